@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        import api.signals  # noqa: F401
+        from api.metrics import instrument_serializers
+
+        instrument_serializers()
@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern, URLResolver
+
+from api.metrics import current_metrics, track_queries
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_VIEW_WORKERS,
+    thread_name_prefix="async-views",
+)
+
+
+def call_blocking(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        metrics = current_metrics.get()
+        if metrics is None:
+            return func(*args, **kwargs)
+        # Соединения с базой у каждого потока свои.
+        with track_queries(metrics):
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполняет блокирующую работу в пуле из `ASYNC_VIEW_WORKERS`
+    потоков, не занимая цикл событий.
+    """
+    return await sync_to_async(
+        call_blocking, thread_sensitive=False, executor=executor,
+    )(func, *args, **kwargs)
+
+
+def get_response(view, request, *args, **kwargs):
+    response = view(request, *args, **kwargs)
+    if hasattr(response, "render"):
+        response.render()
+    return response
+
+
+async def iterate_blocking(iterable):
+    """Части `iterable`, прочитанные в пуле потоков.
+
+    Каждая часть может читаться в другом потоке пула, поэтому итератор
+    не должен опираться на соединения с базой: потоковые ответы
+    собирают данные до возврата из представления, как файл списка
+    покупок.
+    """
+    iterator = iter(iterable)
+    read = sync_to_async(
+        next, thread_sensitive=False, executor=executor)
+    while True:
+        part = await read(iterator, None)
+        if part is None:
+            return
+        yield part
+
+
+def async_view(view):
+    """Асинхронная версия синхронного представления.
+
+    Разбор запроса, работа с базой и рендеринг выполняются в пуле
+    потоков, а отдача ответа медленному клиенту поток не занимает.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await run_blocking(get_response, view, request,
+                                  *args, **kwargs)
+
+    return wrapper
+
+
+def get_async_urlpatterns(urlpatterns, names):
+    """Копия маршрутов, в которой представления с именами из `names`
+    заменены асинхронными версиями.
+    """
+    result = []
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            pattern = URLResolver(
+                pattern.pattern,
+                get_async_urlpatterns(pattern.url_patterns, names),
+                pattern.default_kwargs,
+                pattern.app_name,
+                pattern.namespace,
+            )
+        elif isinstance(pattern, URLPattern) and pattern.name in names:
+            pattern = URLPattern(
+                pattern.pattern,
+                async_view(pattern.callback),
+                pattern.default_args,
+                pattern.name,
+            )
+        result.append(pattern)
+    return result
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+def get_cached_fields(user_model):
+    # Хеш пароля в кеш не попадает и при необходимости читается из базы.
+    return [
+        field.attname for field in user_model._meta.concrete_fields
+        if field.attname != "password"
+    ]
+
+
+def token_cache_key(key):
+    # В общий кеш попадает не сам токен, а его хеш.
+    return f"token:{sha256(key.encode()).hexdigest()}"
+
+
+class TokenCache:
+    """Кеш данных пользователя по токену: LRU в памяти процесса поверх
+    общего кеша.
+
+    Локальная запись живёт `TOKEN_CACHE_LOCAL_TTL` секунд: инвалидация
+    удаляет токен из общего кеша и из LRU своего процесса, а в остальных
+    процессах запись устаревает не позже, чем через этот срок.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.local_hits += 1
+            return value
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._entries[key] = (
+                value, time.monotonic() + settings.TOKEN_CACHE_LOCAL_TTL)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        value = self._get_local(key)
+        if value is not None:
+            return value
+        value = cache.get(token_cache_key(key))
+        if value is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.shared_hits += 1
+        self._set_local(key, value)
+        return value
+
+    def set(self, key, value):
+        cache.set(token_cache_key(key), value, settings.TOKEN_CACHE_TTL)
+        self._set_local(key, value)
+
+    def invalidate(self, key):
+        cache.delete(token_cache_key(key))
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            requests = self.local_hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": settings.TOKEN_CACHE_SIZE,
+                "local_hits": self.local_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": (
+                    (self.local_hits + self.shared_hits) / requests
+                    if requests else None
+                ),
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """`TokenAuthentication`, который не ходит в базу за известным токеном.
+
+    В кеше хранятся значения полей, а не объекты: каждый запрос получает
+    собственные экземпляры пользователя и токена.
+    """
+
+    def authenticate_credentials(self, key):
+        user_model = get_user_model()
+        fields = get_cached_fields(user_model)
+        cached = token_cache.get(key)
+        # Запись, сохранённая до изменения полей пользователя, не подходит.
+        if cached is None or len(cached[1]) != len(fields):
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, (
+                token.created,
+                tuple(getattr(user, field) for field in fields),
+            ))
+            return user, token
+        created, values = cached
+        user = user_model.from_db(
+            router.db_for_read(user_model), fields, values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _("User inactive or deleted."))
+        return user, self.get_model()(key=key, user=user, created=created)
@@ -0,0 +1,112 @@
+import time
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram.db_router import primary_reads
+
+
+def version_key(model):
+    return f"version:{model._meta.label_lower}"
+
+
+def get_versions(*models):
+    """Текущие версии моделей из общего кеша.
+
+    Отсутствующая версия инициализируется текущим временем, а не единицей:
+    после вытеснения ключа из кеша версия не повторит уже выданную.
+    """
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(model):
+    return get_versions(model)[0]
+
+
+def bump_version(model):
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), time.time_ns(), timeout=None)
+
+
+def object_version_key(model, pk):
+    return f"{version_key(model)}:{pk}"
+
+
+def get_object_versions(model, pks):
+    """Версии отдельных объектов: pk -> версия.
+
+    Ключи версий объектов, в отличие от версий моделей, не вечные:
+    запрос может прийти с любым pk, в том числе несуществующим.
+    """
+    keys = {pk: object_version_key(model, pk) for pk in pks}
+    versions = cache.get_many(keys.values())
+    missing = [key for key in keys.values() if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, time.time_ns(),
+                      timeout=settings.OBJECT_VERSION_TIMEOUT)
+        versions.update(cache.get_many(missing))
+    return {pk: versions.get(key) for pk, key in keys.items()}
+
+
+def bump_object_versions(model, pks):
+    version = time.time_ns()
+    cache.set_many(
+        {object_version_key(model, pk): version for pk in pks},
+        timeout=settings.OBJECT_VERSION_TIMEOUT,
+    )
+
+
+class VersionedCacheMixin:
+    """Кеширование ответов `list` и `retrieve` по версиям моделей.
+
+    Ответ зависит только от `cache_models`: пока их версии не изменились,
+    данные берутся из кеша, а на запрос с совпадающим `If-None-Match`
+    возвращается 304 без обращения к базе и сериализатору.
+    """
+
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_etag(self, request):
+        versions = ":".join(map(str, get_versions(*self.cache_models)))
+        key = (f"{request.get_full_path()}:{request.accepted_media_type}:"
+               f"{versions}")
+        return md5(key.encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        headers = {"ETag": f'"{etag}"'}
+        if_none_match = request.headers.get("If-None-Match", "")
+        if headers["ETag"] in (
+            tag.strip() for tag in if_none_match.split(",")
+        ):
+            return Response(status=status.HTTP_304_NOT_MODIFIED,
+                            headers=headers)
+        key = f"response:{etag}"
+        data = cache.get(key)
+        if data is None:
+            with primary_reads():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+        return Response(data, headers=headers)
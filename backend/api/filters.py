@@ -1,14 +1,61 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django_filters import AllValuesMultipleFilter, CharFilter, FilterSet
-from recipes.models import Recipe
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django_filters import (CharFilter, FilterSet, MultipleChoiceFilter,
+                            NumberFilter)
+
+from api.cache import get_version
+from foodgram.db_router import primary_reads
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 
 User = get_user_model()
 
+ORDERING_PARAM = "ordering"
+ORDERING_FIELDS = ("favorites_count", "in_carts_count", "pub_date")
+
+
+def get_recipe_ordering(value):
+    """Сортировка рецептов по значению `?ordering=` или None."""
+    if value and value.lstrip("-") in ORDERING_FIELDS:
+        return (value, "-id" if value.startswith("-") else "id")
+    return None
+
+
+TRUE_VALUES = ("1", "true", "True")
+
+
+def get_tag_map():
+    """Соответствие slug -> id тегов из общего кеша."""
+    key = f"tag_map:{get_version(Tag)}"
+    tags = cache.get(key)
+    if tags is None:
+        with primary_reads():
+            tags = dict(Tag.objects.values_list("slug", "id"))
+        cache.set(key, tags, settings.RESPONSE_CACHE_TIMEOUT)
+    return tags
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in get_tag_map()]
+
 
 class RecipeFilter(FilterSet):
-    tags = AllValuesMultipleFilter(field_name="tags__slug")
+    """Фильтры рецептов без соединений с другими таблицами: теги
+    проверяются подзапросом `Exists` по id, избранное и корзина —
+    подзапросами `Exists`, которые фильтр добавляет как аннотации
+    (если в queryset аннотации с тем же именем ещё нет). Отметки
+    в ответе берутся не из них, а из `api.utils.get_memberships`.
+    """
+
+    tags = MultipleChoiceFilter(choices=get_tag_choices,
+                                method="filter_tags")
     is_favorited = CharFilter(method="filter_is_favorited__in")
     is_in_shopping_cart = CharFilter(method="filter_is_in_shopping_cart__in")
+    author = NumberFilter(field_name="author_id")
+    search = CharFilter(method="filter_search")
+    ordering = CharFilter(method="filter_ordering")
 
     class Meta:
         model = Recipe
@@ -16,14 +63,46 @@ class RecipeFilter(FilterSet):
             "author",
             "tags",
             "is_favorited",
+            "is_in_shopping_cart",
+        )
+
+    def filter_tags(self, queryset, name, value):
+        tag_map = get_tag_map()
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef("pk"),
+                    tag_id__in=[tag_map[slug] for slug in value],
+                )
+            )
         )
 
+    def filter_by_annotation(self, queryset, annotation, model, value):
+        if value not in TRUE_VALUES:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        if annotation not in queryset.query.annotations:
+            queryset = queryset.annotate(**{
+                annotation: Exists(model.objects.filter(
+                    user=user, recipe_id=OuterRef("pk")))
+            })
+        return queryset.filter(**{annotation: True})
+
     def filter_is_favorited__in(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite__user=self.request.user)
-        return queryset
+        return self.filter_by_annotation(
+            queryset, "is_favorited", Favorite, value)
 
     def filter_is_in_shopping_cart__in(self, queryset, name, value):
-        if value:
-            return queryset.filter(shoppingcart__user=self.request.user)
+        return self.filter_by_annotation(
+            queryset, "is_in_shopping_cart", ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        ordering = get_recipe_ordering(value)
+        if ordering:
+            return queryset.order_by(*ordering)
         return queryset
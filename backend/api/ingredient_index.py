@@ -0,0 +1,79 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.cache import get_version
+from foodgram.db_router import primary_reads
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """Префиксный индекс ингредиентов в памяти процесса.
+
+    Ингредиенты хранятся в списке, отсортированном по названию в нижнем
+    регистре; поиск по началу названия — двоичный поиск и срез.
+    Индекс строится при первом обращении и перестраивается, когда
+    меняется версия модели в общем кеше или истекает
+    `INGREDIENT_INDEX_TTL` секунд (для локального кеша, не общего
+    между процессами).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None
+        self._entries = None
+        self._built_at = None
+        self._version = None
+
+    def build(self):
+        version = get_version(Ingredient)
+        with primary_reads():
+            entries = sorted(
+                (name.casefold(), name, ingredient_id, measurement_unit)
+                for ingredient_id, name, measurement_unit
+                in Ingredient.objects.order_by().values_list(
+                    "id", "name", "measurement_unit")
+            )
+        with self._lock:
+            self._keys = [entry[0] for entry in entries]
+            self._entries = [
+                {"id": ingredient_id, "name": name,
+                 "measurement_unit": measurement_unit}
+                for _, name, ingredient_id, measurement_unit in entries
+            ]
+            self._built_at = time.monotonic()
+            self._version = version
+            return self._keys, self._entries
+
+    def load(self):
+        with self._lock:
+            if not self.is_stale():
+                return self._keys, self._entries
+        return self.build()
+
+    def invalidate(self):
+        with self._lock:
+            self._keys = self._entries = self._built_at = None
+
+    def is_stale(self):
+        built_at = self._built_at
+        return (
+            built_at is None
+            or time.monotonic() - built_at > settings.INGREDIENT_INDEX_TTL
+            or self._version != get_version(Ingredient)
+        )
+
+    def search(self, prefix, limit=None):
+        keys, entries = self.load()
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = start
+        stop = len(keys) if limit is None else min(len(keys), start + limit)
+        while end < stop and keys[end].startswith(prefix):
+            end += 1
+        return entries[start:end]
+
+
+ingredient_index = IngredientIndex()
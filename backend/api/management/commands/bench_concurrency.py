@@ -0,0 +1,153 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from django.core.management import BaseCommand, CommandError
+
+from api.management.commands.bench_endpoints import (PERCENTILES,
+                                                     get_endpoints,
+                                                     get_subjects, percentile)
+
+DEFAULT_ENDPOINTS = (
+    "recipes-list",
+    "recipes-detail",
+    "tags-list",
+    "ingredients-search",
+    "download-shopping-cart",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение пропускной способности WSGI- и ASGI-развёртываний при "
+        "параллельных запросах. Оба сервера должны работать с одной базой, "
+        "например: gunicorn foodgram.wsgi:application -b :8000 и "
+        "gunicorn foodgram.asgi:application -k uvicorn.workers.UvicornWorker "
+        "-b :8001."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wsgi", default="http://127.0.0.1:8000",
+            help="Адрес WSGI-развёртывания.",
+        )
+        parser.add_argument(
+            "--asgi", default="http://127.0.0.1:8001",
+            help="Адрес ASGI-развёртывания.",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=32,
+            help="Одновременных клиентов.",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=500,
+            help="Запросов к каждому эндпоинту.",
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=3,
+            help="Запросов для прогрева, не входящих в замер.",
+        )
+        parser.add_argument(
+            "--slow-client", type=float, default=0,
+            help="Пауза в секундах между чтениями блоков ответа, "
+                 "имитирует медленных клиентов.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=16 * 1024,
+            help="Размер блока, читаемого из ответа.",
+        )
+        parser.add_argument(
+            "--endpoint", action="append", dest="endpoints",
+            help="Замерить только эндпоинт с указанным именем.",
+        )
+        parser.add_argument(
+            "--json", dest="json_path",
+            help="Сохранить результаты в JSON-файл.",
+        )
+
+    def handle(self, *args, **options):
+        token, recipe = get_subjects()
+        self.token = token.key
+        self.chunk_size = options["chunk_size"]
+        self.delay = options["slow_client"]
+        endpoints = get_endpoints(
+            recipe, options["endpoints"] or DEFAULT_ENDPOINTS)
+        deployments = {
+            "wsgi": options["wsgi"].rstrip("/"),
+            "asgi": options["asgi"].rstrip("/"),
+        }
+
+        results = {}
+        for name, url in endpoints.items():
+            results[name] = {
+                deployment: self.measure(
+                    base + url,
+                    options["concurrency"],
+                    options["requests"],
+                    options["warmup"],
+                )
+                for deployment, base in deployments.items()
+            }
+            for deployment, result in results[name].items():
+                self.stdout.write(
+                    self.format_result(name, deployment, result))
+            wsgi, asgi = results[name]["wsgi"], results[name]["asgi"]
+            if wsgi["rps"]:
+                self.stdout.write(
+                    f"{name:<24} asgi/wsgi {asgi['rps'] / wsgi['rps']:.2f}")
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def fetch(self, url):
+        request = Request(
+            url, headers={"Authorization": f"Token {self.token}"})
+        started = time.perf_counter()
+        with urlopen(request, timeout=60) as response:
+            while response.read(self.chunk_size):
+                if self.delay:
+                    time.sleep(self.delay)
+        return time.perf_counter() - started
+
+    def measure(self, url, concurrency, requests, warmup):
+        try:
+            for _ in range(warmup):
+                self.fetch(url)
+        except OSError as error:
+            raise CommandError(f"{url}: {error}")
+
+        latencies = []
+        errors = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            futures = [pool.submit(self.fetch, url) for _ in range(requests)]
+            for future in futures:
+                try:
+                    latencies.append(future.result())
+                except OSError:
+                    errors += 1
+            elapsed = time.perf_counter() - started
+
+        return {
+            "url": url,
+            "rps": len(latencies) / elapsed,
+            **{
+                f"p{percent}_ms": (
+                    percentile(latencies, percent) * 1000
+                    if latencies else None
+                )
+                for percent in PERCENTILES
+            },
+            "errors": errors,
+        }
+
+    def format_result(self, name, deployment, result):
+        return (
+            f"{name:<24} {deployment} {result['rps']:8.1f} запр./с "
+            + " ".join(
+                f"p{percent} {result[f'p{percent}_ms'] or 0:7.1f} мс"
+                for percent in PERCENTILES
+            )
+            + f"  ошибок {result['errors']}"
+        )
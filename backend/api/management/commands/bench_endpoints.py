@@ -0,0 +1,165 @@
+import json
+import math
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag, User
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def get_subjects():
+    """Токен пользователя с наибольшим числом подписок и самый популярный
+    рецепт.
+    """
+    user = User.objects.annotate(
+        subscriptions=Count("subscriber")
+    ).order_by("-subscriptions", "id").first()
+    recipe = Recipe.objects.order_by("-favorites_count", "id").first()
+    if user is None or recipe is None:
+        raise CommandError(
+            "Нет данных для замера, сначала выполните generate_data."
+        )
+    token, _ = Token.objects.get_or_create(user=user)
+    return token, recipe
+
+
+def get_endpoints(recipe, names=None):
+    recipes = reverse("recipes-list")
+    tag = Tag.objects.order_by("id").values_list("slug", flat=True)[:1]
+    ingredient = Ingredient.objects.order_by("id").first()
+    word = recipe.name.split()[0]
+    endpoints = {
+        "recipes-list": recipes,
+        "recipes-list-cursor": f"{recipes}?cursor=",
+        "recipes-list-tags": f"{recipes}?tags={''.join(tag)}",
+        "recipes-list-search": f"{recipes}?{urlencode({'search': word})}",
+        "recipes-list-popular": f"{recipes}?ordering=-favorites_count",
+        "recipes-detail": reverse("recipes-detail", args=(recipe.id,)),
+        "recipes-feed": reverse("recipes-feed"),
+        "subscriptions": f"{reverse('subscriptions')}?recipes_limit=3",
+        "users-list": reverse("users-list"),
+        "tags-list": reverse("tags-list"),
+        "ingredients-search": (
+            f"{reverse('ingredients-list')}?"
+            f"{urlencode({'name': ingredient.name[:2]})}"
+            if ingredient else reverse("ingredients-list")
+        ),
+        "download-shopping-cart": reverse("download-shopping-cart"),
+    }
+    if names:
+        return {
+            name: url for name, url in endpoints.items() if name in names
+        }
+    return endpoints
+
+
+class QueryCounter:
+    def __init__(self):
+        self.queries = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер основных эндпоинтов api.urls через тестовый клиент Django: "
+        "перцентили задержки, число запросов к базе и пик памяти. "
+        "Данные для замера готовит generate_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=50,
+            help="Запросов к каждому эндпоинту.",
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=3,
+            help="Запросов для прогрева, не входящих в замер.",
+        )
+        parser.add_argument(
+            "--endpoint", action="append", dest="endpoints",
+            help="Замерить только эндпоинт с указанным именем.",
+        )
+        parser.add_argument(
+            "--json", dest="json_path",
+            help="Сохранить результаты в JSON-файл.",
+        )
+
+    def handle(self, *args, **options):
+        token, recipe = get_subjects()
+        client = Client(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        endpoints = get_endpoints(recipe, options["endpoints"])
+        results = {}
+        for name, url in endpoints.items():
+            results[name] = self.measure(
+                client, url, options["requests"], options["warmup"])
+            self.stdout.write(self.format_result(name, results[name]))
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url}: статус {response.status_code}")
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def measure(self, client, url, requests, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+
+        latencies = []
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            for _ in range(requests):
+                started = time.perf_counter()
+                self.request(client, url)
+                latencies.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        try:
+            self.request(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "url": url,
+            **{
+                f"p{percent}_ms": percentile(latencies, percent) * 1000
+                for percent in PERCENTILES
+            },
+            "queries": counter.queries / requests,
+            "peak_kb": peak / 1024,
+        }
+
+    def format_result(self, name, result):
+        return (
+            f"{name:<24} "
+            + " ".join(
+                f"p{percent} {result[f'p{percent}_ms']:7.1f} мс"
+                for percent in PERCENTILES
+            )
+            + f"  запросов {result['queries']:5.1f}"
+            f"  пик памяти {result['peak_kb']:8.1f} КБ"
+        )
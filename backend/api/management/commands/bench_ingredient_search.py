@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from api.ingredient_index import IngredientIndex
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение поиска ингредиентов по началу названия: "
+        "префиксный индекс в памяти и запрос к базе данных."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="Сколько раз прогнать набор префиксов.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=settings.INGREDIENT_SEARCH_LIMIT,
+            help="Ограничение числа результатов.",
+        )
+
+    def handle(self, *args, **options):
+        limit = options["limit"]
+        names = Ingredient.objects.values_list("name", flat=True)
+        prefixes = sorted({
+            name[:length]
+            for name in names
+            for length in (1, 2, 3)
+            if len(name) >= length
+        })
+        if not prefixes:
+            self.stdout.write(self.style.ERROR(
+                "Нет ингредиентов, сначала выполните load_csv."
+            ))
+            return
+
+        index = IngredientIndex()
+        started = time.perf_counter()
+        index.build()
+        build_time = time.perf_counter() - started
+
+        def orm_search(prefix):
+            return list(
+                Ingredient.objects.filter(name__istartswith=prefix)
+                .values("id", "name", "measurement_unit")[:limit]
+            )
+
+        results = {}
+        for label, search in (
+            ("ORM", orm_search),
+            ("Индекс", lambda prefix: index.search(prefix, limit)),
+        ):
+            started = time.perf_counter()
+            for _ in range(options["repeat"]):
+                for prefix in prefixes:
+                    search(prefix)
+            results[label] = (
+                (time.perf_counter() - started)
+                / (options["repeat"] * len(prefixes))
+            )
+
+        self.stdout.write(
+            f"Префиксов: {len(prefixes)}, повторов: {options['repeat']}, "
+            f"построение индекса: {build_time * 1000:.1f} мс"
+        )
+        for label, seconds in results.items():
+            self.stdout.write(f"{label}: {seconds * 1e6:.1f} мкс на запрос")
+        self.stdout.write(self.style.SUCCESS(
+            f"Ускорение: {results['ORM'] / results['Индекс']:.1f}x"
+        ))
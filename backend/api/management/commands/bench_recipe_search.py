@@ -0,0 +1,94 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from recipes.models import Recipe
+from recipes.search import search_recipes
+
+User = get_user_model()
+
+SYLLABLES = (
+    "ка", "ло", "ми", "ра", "ту", "не", "со", "ви", "ба", "гу",
+    "де", "жа", "зо", "ли", "пе", "ро", "сы", "фа", "ха", "чу",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнение полнотекстового поиска рецептов с поиском по подстроке "
+        "на синтетическом наборе данных. Данные создаются во временной "
+        "транзакции и откатываются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipes", type=int, default=100_000,
+            help="Количество рецептов в наборе.",
+        )
+        parser.add_argument(
+            "--queries", type=int, default=50,
+            help="Количество поисковых запросов.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=42,
+            help="Начальное значение генератора случайных чисел.",
+        )
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options["seed"])
+        vocabulary = [
+            "".join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4)))
+            for _ in range(5000)
+        ]
+        queries = rnd.sample(vocabulary, options["queries"])
+        with transaction.atomic():
+            self.create_recipes(rnd, vocabulary, options["recipes"])
+            results = {
+                "Подстрока": self.measure(queries, lambda queryset, value: (
+                    queryset.filter(
+                        Q(name__icontains=value) | Q(text__icontains=value))
+                )),
+                "Полнотекстовый": self.measure(queries, search_recipes),
+            }
+            transaction.set_rollback(True)
+        self.stdout.write(
+            f"Рецептов: {options['recipes']}, запросов: {len(queries)}"
+        )
+        for label, seconds in results.items():
+            self.stdout.write(f"{label}: {seconds * 1000:.2f} мс на запрос")
+        self.stdout.write(self.style.SUCCESS(
+            "Ускорение: "
+            f"{results['Подстрока'] / results['Полнотекстовый']:.1f}x"
+        ))
+
+    def create_recipes(self, rnd, vocabulary, count):
+        author = User.objects.create(
+            username="bench_recipe_search",
+            email="bench_recipe_search@example.com",
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    name=" ".join(rnd.choices(vocabulary, k=3)),
+                    text=" ".join(rnd.choices(vocabulary, k=40)),
+                    cooking_time=rnd.randint(1, 180),
+                    image="recipes/bench.jpg",
+                )
+                for _ in range(count)
+            ),
+            batch_size=1000,
+        )
+
+    def measure(self, queries, search):
+        started = time.perf_counter()
+        for value in queries:
+            list(
+                search(Recipe.objects.all(), value)
+                .values_list("id", flat=True)[:10]
+            )
+        return (time.perf_counter() - started) / len(queries)
@@ -0,0 +1,14 @@
+from django.core.management import BaseCommand
+
+from api.shopping_list_cache import shopping_list_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаление устаревших файлов списков покупок и самых давно "
+        "выданных, пока кеш больше SHOPPING_LIST_CACHE_MAX_SIZE."
+    )
+
+    def handle(self, *args, **options):
+        removed = shopping_list_cache.prune()
+        self.stdout.write(f"Удалено файлов: {removed}")
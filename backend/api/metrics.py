@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar("current_metrics", default=None)
+
+
+class RequestMetrics:
+    """Число запросов к базе и время, потраченное запросом."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.total_time = 0.0
+        self.serializer_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    def server_timing(self):
+        return ", ".join((
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f"serializer;dur={self.serializer_time * 1000:.1f}",
+            f"total;dur={self.total_time * 1000:.1f}",
+        ))
+
+    def get_overruns(self, budget):
+        """Показатели, превысившие бюджет: имя -> (значение, лимит)."""
+        values = {
+            "queries": self.queries,
+            "db_ms": self.db_time * 1000,
+            "total_ms": self.total_time * 1000,
+        }
+        return {
+            name: (values[name], limit)
+            for name, limit in budget.items()
+            if limit is not None and values[name] > limit
+        }
+
+
+@contextmanager
+def track_queries(metrics):
+    """Учитывает в `metrics` запросы, выполненные в текущем потоке."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(
+                connection.execute_wrapper(metrics.record_query))
+        yield
+
+
+def get_budget(view_name, method):
+    if method == "HEAD":
+        method = "GET"
+    return {
+        **settings.REQUEST_BUDGET_DEFAULT,
+        **settings.REQUEST_BUDGETS.get((view_name, method), {}),
+    }
+
+
+def timed_data(fget):
+    def data(serializer):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return fget(serializer)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return fget(serializer)
+        finally:
+            metrics.serializer_depth -= 1
+            if not metrics.serializer_depth:
+                metrics.serializer_time += time.perf_counter() - started
+
+    return data
+
+
+def instrument_serializers():
+    """Учитывает время сериализации в метриках текущего запроса.
+
+    `Serializer.data` и `ListSerializer.data` вызывают `BaseSerializer.data`,
+    поэтому достаточно обернуть его; вложенные вызовы учитываются один раз.
+    """
+    if not getattr(BaseSerializer.data, "instrumented", False):
+        BaseSerializer.data = property(timed_data(BaseSerializer.data.fget))
+        BaseSerializer.data.fget.instrumented = True
+
+
+class RequestMetricsMiddleware:
+    """Заголовок `Server-Timing` и журнал запросов сверх бюджета.
+
+    Бюджеты задаются в `REQUEST_BUDGETS` по имени маршрута и методу,
+    недостающие значения берутся из `REQUEST_BUDGET_DEFAULT`.
+    Под ASGI запросы к базе учитываются только у представлений,
+    выполняемых через `api.async_views.run_blocking`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Признак, по которому Django вызывает middleware асинхронно.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with track_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def acall(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def finish(self, request, response, metrics, started):
+        metrics.total_time = time.perf_counter() - started
+        response.request_metrics = metrics
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = metrics.server_timing()
+
+        match = request.resolver_match
+        # Бюджеты действуют только для представлений DRF.
+        if match is not None and hasattr(match.func, "cls"):
+            response.budget_key = (match.view_name, request.method)
+            overruns = metrics.get_overruns(get_budget(*response.budget_key))
+            if overruns:
+                logger.warning(
+                    "Превышен бюджет %s %s (%s): %s",
+                    request.method,
+                    request.path,
+                    match.view_name,
+                    ", ".join(
+                        f"{name} {value:g} > {limit:g}"
+                        for name, (value, limit) in overruns.items()
+                    ),
+                )
+        return response
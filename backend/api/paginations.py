@@ -1,6 +1,176 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+from api.filters import ORDERING_PARAM, get_recipe_ordering
 
 
 class PageNumberPagination(PageNumberPagination):
     page_size = 6
-    page_size_param = "limit"
+    page_size_query_param = "limit"
+
+
+class CursorPagination(pagination.CursorPagination):
+    """Курсорная пагинация по ключу из всех полей сортировки.
+
+    Курсор хранит значения этих полей у крайней строки страницы, и
+    следующая страница выбирается условием
+    `(a < x) OR (a = x AND b < y)` по индексу, без OFFSET, даже когда
+    строки совпадают по первому полю. Последнее поле сортировки должно
+    быть уникальным, а направление у всех полей — одинаковым.
+    """
+
+    page_size = 6
+    page_size_query_param = "limit"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip("-"))
+            for name in self.ordering
+        ]
+        position, reverse = self.cursor = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = [
+                name[1:] if name.startswith("-") else f"-{name}"
+                for name in ordering
+            ]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                self.get_position_filter(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+        if self.has_previous or self.has_next:
+            self.display_page_controls = True
+        return self.page
+
+    def get_position_filter(self, ordering, position):
+        """Строки после `position` в порядке `ordering`."""
+        condition = Q()
+        equal = {}
+        for name, field, value in zip(ordering, self.fields, position):
+            try:
+                value = field.to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = "lt" if name.startswith("-") else "gt"
+            name = name.lstrip("-")
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, instance):
+        return [field.value_to_string(instance) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor((self.get_position(self.page[-1]), False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Пустая страница после удаления строк: назад от той же позиции.
+            return self.encode_cursor((self.cursor[0], True))
+        return self.encode_cursor((self.get_position(self.page[0]), True))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            position, reverse = json.loads(urlsafe_b64decode(encoded))
+            if len(position) != len(self.fields) or not all(
+                isinstance(value, str) for value in position
+            ):
+                raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, bool(reverse)
+
+    def encode_cursor(self, cursor):
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded)
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Рецепты по `?ordering=` или от новых к старым.
+
+    Результаты поиска `?search=` в этом режиме тоже идут по дате, а не
+    по релевантности: ранг вычисляется в запросе, не попадает в индекс
+    и как дробное число не годится для ключа курсора.
+    """
+
+    ordering = ("-pub_date", "-id")
+
+    def get_ordering(self, request, queryset, view):
+        return get_recipe_ordering(
+            request.query_params.get(ORDERING_PARAM)) or self.ordering
+
+
+class SubscriptionCursorPagination(CursorPagination):
+    ordering = "id"
+
+
+class FeedCursorPagination(CursorPagination):
+    ordering = ("-pub_date", "-recipe_id")
+
+
+class SelectablePagination(pagination.BasePagination):
+    """Постраничная пагинация или, если в запросе есть параметр `cursor`
+    (в том числе пустой), курсорная по индексированному полю.
+    """
+
+    page_pagination_class = PageNumberPagination
+    cursor_pagination_class = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.paginator = self.cursor_pagination_class()
+        else:
+            self.paginator = self.page_pagination_class()
+        page = self.paginator.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.paginator.display_page_controls
+        return page
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+
+class RecipePagination(SelectablePagination):
+    cursor_pagination_class = RecipeCursorPagination
+
+
+class SubscriptionPagination(SelectablePagination):
+    cursor_pagination_class = SubscriptionCursorPagination
+
+
+class FeedPagination(SelectablePagination):
+    cursor_pagination_class = FeedCursorPagination
@@ -0,0 +1,58 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+
+from api.cache import get_object_versions, get_versions
+from api.serializers import (RecipeReadSerializer,
+                             get_representation_queryset)
+from api.utils import apply_memberships
+from foodgram.db_router import primary_reads
+from recipes.models import Ingredient, Recipe, Tag
+
+
+def get_cache_keys(recipe_ids, request):
+    # Адреса изображений абсолютные, поэтому зависят от хоста запроса.
+    origin = md5(
+        f"{request.scheme}://{request.get_host()}".encode()).hexdigest()
+    tag_version, ingredient_version = get_versions(Tag, Ingredient)
+    return {
+        recipe_id: (
+            f"recipe:{recipe_id}:{version}:{tag_version}:"
+            f"{ingredient_version}:{origin}"
+        )
+        for recipe_id, version
+        in get_object_versions(Recipe, recipe_ids).items()
+    }
+
+
+def get_recipes_data(recipe_ids, request):
+    """Представления рецептов в порядке `recipe_ids`.
+
+    Общая часть берётся из кеша по id и версии рецепта (а также версиям
+    тегов и ингредиентов) и загружается из базы только для промахов.
+    `is_favorited`, `is_in_shopping_cart` и `author.is_subscribed`
+    проставляются поверх по одному запросу на всю страницу.
+    Отсутствующие рецепты пропускаются.
+    """
+    keys = get_cache_keys(recipe_ids, request)
+    cached = cache.get_many(keys.values())
+    missing = [
+        recipe_id for recipe_id, key in keys.items() if key not in cached
+    ]
+    if missing:
+        with primary_reads():
+            loaded = {
+                keys[recipe.id]: RecipeReadSerializer(
+                    recipe, context={"request": request}).data
+                for recipe in get_representation_queryset().filter(
+                    id__in=missing)
+            }
+        cache.set_many(loaded, settings.RECIPE_CACHE_TIMEOUT)
+        cached.update(loaded)
+
+    return apply_memberships(
+        [cached[keys[recipe_id]] for recipe_id in recipe_ids
+         if keys[recipe_id] in cached],
+        request.user,
+    )
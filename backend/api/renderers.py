@@ -0,0 +1,135 @@
+import csv
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+SHOPPING_CART_TITLE = "Список покупок с сайта Foodgram:"
+SHOPPING_CART_HEADER = ("Ингредиент", "Единица измерения", "Количество")
+CHUNK_SIZE = 64 * 1024
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Базовый рендерер списка покупок.
+
+    `stream` отдаёт файл частями по мере чтения ингредиентов из базы,
+    `render` собирает его целиком.
+    """
+
+    charset = "utf-8"
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b"".join(self.stream(data))
+
+
+class ShoppingCartTextRenderer(ShoppingCartRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, ingredients):
+        yield f"{SHOPPING_CART_TITLE}\n\n".encode(self.charset)
+        for item in ingredients:
+            yield (
+                f"{item['ingredient__name']}, {item['total_amount']} "
+                f"{item['ingredient__measurement_unit']}\n"
+            ).encode(self.charset)
+
+
+class Echo:
+    """Файлоподобный объект, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartCSVRenderer(ShoppingCartRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(SHOPPING_CART_HEADER).encode(self.charset)
+        for item in ingredients:
+            yield writer.writerow((
+                item["ingredient__name"],
+                item["ingredient__measurement_unit"],
+                item["total_amount"],
+            )).encode(self.charset)
+
+
+@lru_cache(maxsize=None)
+def register_pdf_font():
+    pdfmetrics.registerFont(
+        TTFont("ShoppingCartFont", settings.SHOPPING_CART_PDF_FONT))
+    return "ShoppingCartFont"
+
+
+class ShoppingCartPDFRenderer(ShoppingCartRenderer):
+    """PDF нельзя отдавать до завершения вёрстки, поэтому документ
+    собирается во временный файл, который держится в памяти только
+    до `CHUNK_SIZE`, и затем отдаётся частями.
+    """
+
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    font_size = 12
+    margin = 50
+
+    def stream(self, ingredients):
+        font = register_pdf_font()
+        width, height = A4
+        line_height = self.font_size * 1.5
+        with SpooledTemporaryFile(max_size=CHUNK_SIZE) as file:
+            canvas = Canvas(file, pagesize=A4)
+            canvas.setFont(font, self.font_size)
+            y = height - self.margin
+            for line in self.lines(ingredients):
+                if y < self.margin:
+                    canvas.showPage()
+                    canvas.setFont(font, self.font_size)
+                    y = height - self.margin
+                canvas.drawString(self.margin, y, line)
+                y -= line_height
+            canvas.save()
+            file.seek(0)
+            yield from iter(lambda: file.read(CHUNK_SIZE), b"")
+
+    def lines(self, ingredients):
+        yield SHOPPING_CART_TITLE
+        yield ""
+        for item in ingredients:
+            yield (
+                f"• {item['ingredient__name']} "
+                f"({item['ingredient__measurement_unit']}) — "
+                f"{item['total_amount']}"
+            )
+
+
+SHOPPING_CART_RENDERERS = (
+    ShoppingCartTextRenderer,
+    ShoppingCartCSVRenderer,
+    ShoppingCartPDFRenderer,
+)
+
+
+class ShoppingCartContentNegotiation(DefaultContentNegotiation):
+    """Формат выбирается по `?format=` или `Accept`; если `Accept` не
+    подходит ни одному рендереру, отдаётся текстовый файл.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import transaction
+from django.db.models import BooleanField, Prefetch, Value
 from djoser.serializers import (
     UserCreateSerializer as DjoserUserCreateSerializer
 )
@@ -6,12 +8,17 @@ from djoser.serializers import UserSerializer as DjoserUserSerializer
 from rest_framework import serializers
 
 from users.models import Subscribe
+from api.signals import invalidate_recipes
+from api.utils import apply_memberships
+from recipes.images import schedule_image_processing
 from recipes.models import (
     Favorite,
+    FeedEntry,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
     User,
 )
@@ -19,6 +26,55 @@ from recipes.models import (
 from drf_extra_fields.fields import Base64ImageField
 
 
+class ImageVariantField(serializers.ImageField):
+    """Уменьшенная копия изображения рецепта; пока она не готова,
+    отдаётся оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
+
+
+def get_objects_by_ids(queryset, ids):
+    """Объекты `queryset` по id одним запросом; все неизвестные id
+    перечисляются в одной ошибке.
+    """
+    objects = queryset.in_bulk(ids)
+    missing = [pk for pk in dict.fromkeys(ids) if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(
+            f"{queryset.model._meta.verbose_name_plural} с id "
+            f"{', '.join(str(pk) for pk in missing)} не найдены."
+        )
+    return objects
+
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список id, который превращается в объекты `queryset`
+    через `get_objects_by_ids`.
+    """
+
+    child = serializers.IntegerField(min_value=1)
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        ids = super().to_internal_value(data)
+        objects = get_objects_by_ids(self.queryset, ids)
+        return [objects[pk] for pk in ids]
+
+    def to_representation(self, value):
+        if hasattr(value, "all"):
+            value = value.all()
+        return [item.pk for item in value]
+
+
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tag
@@ -37,6 +93,8 @@ class UserSerializer(DjoserUserSerializer):
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
+        if hasattr(obj, "subscribed"):
+            return obj.subscribed
         return Subscribe.objects.filter(user=user, author=obj).exists()
 
 
@@ -67,14 +125,22 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class CreateIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    # Ингредиенты всего рецепта загружаются разом
+    # в `CreateRecipeSerializer.validate_ingredients`.
+    id = serializers.IntegerField(source="ingredient_id", min_value=1)
 
     class Meta:
         model = RecipeIngredient
         fields = ("id", "amount")
+        extra_kwargs = {
+            "amount": {
+                "min_value": 1,
+                "error_messages": {
+                    "min_value":
+                        "Количество ингредиентов не может быть меньше 1.",
+                },
+            },
+        }
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
@@ -85,6 +151,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.BooleanField(
         read_only=True, default=False)
     is_favorited = serializers.BooleanField(read_only=True, default=False)
+    image_card = ImageVariantField()
+    image_detail = ImageVariantField()
 
     class Meta:
         model = Recipe
@@ -93,6 +161,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "name",
             "text",
             "image",
+            "image_card",
+            "image_detail",
             "tags",
             "ingredients",
             "cooking_time",
@@ -102,8 +172,27 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
 
+def get_representation_queryset():
+    """Рецепты со связанными данными для общей, не зависящей от
+    пользователя части представления.
+    """
+    return Recipe.objects.prefetch_related(
+        Prefetch(
+            "author",
+            queryset=User.objects.annotate(
+                subscribed=Value(False, output_field=BooleanField())),
+        ),
+        "tags",
+        Prefetch(
+            "recipe_ingredients",
+            queryset=RecipeIngredient.objects.select_related("ingredient"),
+        ),
+    )
+
+
 class CreateRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(required=False, allow_null=True)
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     ingredients = CreateIngredientSerializer(many=True)
     cooking_time = serializers.IntegerField()
 
@@ -139,6 +228,9 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
                 for ingredient_data in ingredients
             ]
         )
+        if recipe.image:
+            schedule_image_processing(recipe)
+        FeedEntry.objects.publish(recipe)
 
         return recipe
 
@@ -158,48 +250,117 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         for tag in tags:
             recipe.tags.set(tag)
 
-    @transaction.atomic
-    def update(self, instance, validated_data):
-        instance.recipe_ingredients.all().delete()
-        ingredients = validated_data.pop("ingredients")
+    def update_ingredients(self, recipe, ingredients):
+        """Приводит ингредиенты рецепта к присланным, добавляя, меняя
+        и удаляя только отличающиеся строки.
+
+        Возвращает изменения количеств: ингредиент -> разница.
+        """
+        submitted = {
+            ingredient_data["ingredient"].id: ingredient_data["amount"]
+            for ingredient_data in ingredients
+        }
+        kept = {}
+        old_amounts = {}
+        deleted = []
+        for pk, ingredient_id, amount in recipe.recipe_ingredients.values_list(
+            "id", "ingredient_id", "amount"
+        ):
+            old_amounts[ingredient_id] = (
+                old_amounts.get(ingredient_id, 0) + amount)
+            if ingredient_id in kept or ingredient_id not in submitted:
+                deleted.append(pk)
+            else:
+                kept[ingredient_id] = RecipeIngredient(
+                    id=pk, recipe=recipe, ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+        changed = [
+            recipe_ingredient for ingredient_id, recipe_ingredient
+            in kept.items()
+            if recipe_ingredient.amount != submitted[ingredient_id]
+        ]
+        for recipe_ingredient in changed:
+            recipe_ingredient.amount = submitted[
+                recipe_ingredient.ingredient_id]
+
+        if deleted:
+            RecipeIngredient.objects.filter(pk__in=deleted).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
         RecipeIngredient.objects.bulk_create(
             [
-                RecipeIngredient(
-                    recipe=instance,
-                    ingredient=ingredient_data.get("ingredient"),
-                    amount=ingredient_data["amount"],
-                )
-                for ingredient_data in ingredients
+                RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                 amount=amount)
+                for ingredient_id, amount in submitted.items()
+                if ingredient_id not in kept
             ]
         )
-        return super().update(instance, validated_data)
+        return {
+            ingredient_id: (
+                submitted.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in submitted.keys() | old_amounts.keys()
+            if submitted.get(ingredient_id) != old_amounts.get(ingredient_id)
+        }
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        amounts = self.update_ingredients(
+            instance, validated_data.pop("ingredients"))
+        if amounts:
+            ShoppingListItem.objects.change(
+                list(instance.shoppingcart_set.values_list(
+                    "user_id", flat=True)),
+                amounts,
+            )
+        if "tags" in validated_data:
+            # `set` сам сравнивает теги и меняет только отличающиеся.
+            instance.tags.set(validated_data.pop("tags"))
+
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+        elif amounts:
+            # Без сохранения рецепта кеш представления сбрасывается явно.
+            invalidate_recipes([instance.id])
+        if validated_data.get("image"):
+            schedule_image_processing(instance)
+        return instance
+
+    def validate_ingredients(self, ingredients):
+        ingredient_ids = [
+            ingredient_data["ingredient_id"] for ingredient_data in ingredients
+        ]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                "Исключите повторяющиеся ингредиенты."
+            )
+        objects = get_objects_by_ids(Ingredient.objects.all(), ingredient_ids)
+        return [
+            {
+                "ingredient": objects[ingredient_data["ingredient_id"]],
+                "amount": ingredient_data["amount"],
+            }
+            for ingredient_data in ingredients
+        ]
 
     def validate(self, data):
+        # Частичное обновление тоже требует всех полей рецепта.
         for field in ("tags", "ingredients", "name", "text", "cooking_time"):
-            if not self.initial_data.get(field):
+            if not data.get(field):
                 raise serializers.ValidationError(
                     f"Поле `{field}` не заполнено")
-        ingredients = self.initial_data["ingredients"]
-        ingredients_set = set()
-        for ingredient in ingredients:
-            if not ingredient.get("amount") or not ingredient.get("id"):
-                raise serializers.ValidationError(
-                    "Укажите `amount` и `id` для ингредиента."
-                )
-            if not int(ingredient["amount"]) > 0:
-                raise serializers.ValidationError(
-                    "Количество ингредиентов не может быть меньше 1."
-                )
-            if ingredient["id"] in ingredients_set:
-                raise serializers.ValidationError(
-                    "Исключите повторяющиеся ингредиенты."
-                )
-            ingredients_set.add(ingredient["id"])
         return data
 
     def validate_cooking_time(self, data):
-        cooking_time = self.initial_data.get('cooking_time')
-        if int(cooking_time) < 1:
+        if data < 1:
             raise serializers.ValidationError(
                 'Время приготовления не может быть меньше 1 минуты'
             )
@@ -207,9 +368,14 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         return data
 
     def to_representation(self, instance):
-        return RecipeReadSerializer(
-            instance, context={"request": self.context.get("request")}
-        ).data
+        # Из базы, а не из кеша: версия рецепта меняется только после
+        # фиксации транзакции.
+        request = self.context.get("request")
+        recipe = get_representation_queryset().get(pk=instance.pk)
+        return apply_memberships(
+            [RecipeReadSerializer(recipe, context={"request": request}).data],
+            request.user,
+        )[0]
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -291,6 +457,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
+    is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
     recipes_count = serializers.SerializerMethodField()
 
@@ -309,16 +476,23 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, username):
         user = self.context["request"].user
-        return (
-            not user.is_anonymous
-            and Subscribe.objects.filter(user=user, author=username).exists()
-        )
+        if user.is_anonymous:
+            return False
+        if hasattr(username, "subscribed"):
+            return username.subscribed
+        return Subscribe.objects.filter(user=user, author=username).exists()
 
     def get_recipes(self, obj):
-        return ActionRecipeSerializer(Recipe.objects.filter(author=obj),
-                                      many=True).data
+        if hasattr(obj, "recipes_preview"):
+            recipes = obj.recipes_preview
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+        return ActionRecipeSerializer(
+            recipes, many=True, context=self.context).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return Recipe.objects.filter(author=obj).count()
 
 
@@ -327,6 +501,21 @@ class ActionRecipeSerializer(serializers.ModelSerializer):
     удаления рецепта в избранном, списке покупок.
     """
 
+    image_card = ImageVariantField()
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_card", "cooking_time")
+
+
+class BatchSerializer(serializers.Serializer):
+    """Список id для пакетного добавления или удаления."""
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_SIZE_LIMIT,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
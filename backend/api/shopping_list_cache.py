@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+import uuid
+from hashlib import sha256
+from pathlib import Path
+
+from django.conf import settings
+
+from api.cache import get_object_versions, get_version
+from recipes.models import Ingredient, Recipe, ShoppingCart
+
+# Меняется вместе с содержимым файлов, которое выдают рендереры.
+FILE_FORMAT_VERSION = 1
+
+
+def get_shopping_list_digest(user, renderer):
+    """Хеш содержимого файла: рецепты в корзине с их версиями, версия
+    ингредиентов и формат.
+    """
+    recipe_ids = list(
+        ShoppingCart.objects.filter(user=user)
+        .order_by("recipe_id").values_list("recipe_id", flat=True)
+    )
+    versions = get_object_versions(Recipe, recipe_ids)
+    content = ",".join(
+        f"{recipe_id}:{versions[recipe_id]}" for recipe_id in recipe_ids)
+    return sha256(
+        f"{FILE_FORMAT_VERSION}:{renderer.format}:"
+        f"{get_version(Ingredient)}:{content}".encode()
+    ).hexdigest()
+
+
+class ShoppingListCache:
+    """Готовые файлы списков покупок на диске, по хешу содержимого.
+
+    Одинаковые корзины дают один и тот же файл. При выдаче файла
+    обновляется время его изменения; `prune` удаляет файлы старше
+    `SHOPPING_LIST_CACHE_MAX_AGE` секунд, а затем самые давно выданные,
+    пока общий размер больше `SHOPPING_LIST_CACHE_MAX_SIZE` байт.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pruned_at = None
+
+    @property
+    def directory(self):
+        return Path(settings.SHOPPING_LIST_CACHE_DIR)
+
+    def get_path(self, digest, renderer):
+        return self.directory / f"{digest}.{renderer.format}"
+
+    def open(self, digest, renderer):
+        """Открытый файл или None, если его нет в кеше."""
+        path = self.get_path(digest, renderer)
+        try:
+            file = path.open("rb")
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return file
+
+    def store(self, digest, renderer, chunks):
+        """Записывает файл из `chunks` и возвращает его открытым."""
+        path = self.get_path(digest, renderer)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Файл появляется под своим именем только целиком.
+        temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        try:
+            with temp_path.open("wb") as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                temp_path.unlink()
+            except FileNotFoundError:
+                pass
+            raise
+        file = path.open("rb")
+        self.prune_periodically()
+        return file
+
+    def prune_periodically(self):
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._pruned_at is not None
+                and now - self._pruned_at
+                < settings.SHOPPING_LIST_CACHE_PRUNE_INTERVAL
+            ):
+                return
+            self._pruned_at = now
+        self.prune()
+
+    def prune(self):
+        """Удаляет устаревшие и лишние файлы; возвращает их число."""
+        if not self.directory.is_dir():
+            return 0
+        expired_at = time.time() - settings.SHOPPING_LIST_CACHE_MAX_AGE
+        entries = []
+        removed = 0
+        for path in self.directory.iterdir():
+            try:
+                stat = path.stat()
+                if stat.st_mtime < expired_at:
+                    path.unlink()
+                    removed += 1
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                continue
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= settings.SHOPPING_LIST_CACHE_MAX_SIZE:
+                break
+            try:
+                path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        return removed
+
+
+shopping_list_cache = ShoppingListCache()
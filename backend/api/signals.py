@@ -0,0 +1,76 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.cache import bump_object_versions, bump_version
+from api.ingredient_index import ingredient_index
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+
+
+def invalidate_recipes(recipe_ids):
+    # После фиксации транзакции: иначе параллельный запрос может
+    # закешировать старые данные под новой версией.
+    transaction.on_commit(
+        lambda: bump_object_versions(Recipe, recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump_version(Ingredient)
+    ingredient_index.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    bump_version(Tag)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, **kwargs):
+    # Смена пароля, деактивация и любые другие изменения пользователя.
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list(
+        "key", flat=True
+    ):
+        token_cache.invalidate(key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(("last_login",)):
+        return
+    invalidate_recipes(list(
+        Recipe.objects.filter(author=instance).values_list("id", flat=True)
+    ))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes([instance.id])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    invalidate_recipes([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_recipes([instance.id])
+    elif pk_set:
+        invalidate_recipes(list(pk_set))
+    else:
+        # Очистка всех рецептов у тега: сами рецепты уже неизвестны,
+        # достаточно сменить версию тегов.
+        bump_version(Tag)
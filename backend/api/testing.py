@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver
+
+from api import urls
+from api.metrics import get_budget
+
+
+def assert_within_budget(response):
+    """Падает, если запрос превысил бюджет своего маршрута и метода.
+
+    Метрики собирает `RequestMetricsMiddleware`, поэтому ответ должен
+    быть получен тестовым клиентом через полный стек middleware.
+    """
+    metrics = getattr(response, "request_metrics", None)
+    budget_key = getattr(response, "budget_key", None)
+    if metrics is None or budget_key is None:
+        raise AssertionError(
+            "В ответе нет метрик: подключите RequestMetricsMiddleware."
+        )
+    overruns = metrics.get_overruns(get_budget(*budget_key))
+    if overruns:
+        view_name, method = budget_key
+        raise AssertionError(
+            f"{method} {view_name} превысил бюджет: " + ", ".join(
+                f"{name} {value:g} > {limit:g}"
+                for name, (value, limit) in overruns.items()
+            )
+        )
+
+
+def get_view_methods(callback):
+    """Методы представления без HEAD (у него бюджет GET) и OPTIONS."""
+    actions = getattr(callback, "actions", None)
+    if actions is None:
+        view_class = callback.view_class
+        methods = [
+            method for method in view_class.http_method_names
+            if hasattr(view_class, method)
+        ]
+    else:
+        methods = list(actions)
+    return {
+        method.upper() for method in methods
+        if method not in ("head", "options")
+    }
+
+
+def get_api_routes(patterns=None):
+    """Методы маршрутов `api.urls` по имени, чтобы проверить каждый."""
+    routes = {}
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            for name, methods in get_api_routes(pattern.url_patterns).items():
+                routes.setdefault(name, set()).update(methods)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            routes.setdefault(pattern.name, set()).update(
+                get_view_methods(pattern.callback))
+    return routes
+
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+
+@contextmanager
+def capture_writes(using=DEFAULT_DB_ALIAS):
+    """Собирает в список INSERT, UPDATE и DELETE, выполненные в блоке."""
+    writes = []
+    with CaptureQueriesContext(connections[using]) as context:
+        yield writes
+    writes.extend(
+        query["sql"] for query in context.captured_queries
+        if query["sql"].lstrip().upper().startswith(WRITE_STATEMENTS)
+    )
+
+
+class BudgetTestMixin:
+    """Примесь к `TestCase` с проверками бюджета запроса и числа
+    изменяющих запросов.
+    """
+
+    def assertWithinBudget(self, response):  # noqa: N802
+        try:
+            assert_within_budget(response)
+        except AssertionError as error:
+            self.fail(str(error))
+
+    @contextmanager
+    def assertNumWrites(self, number, using=DEFAULT_DB_ALIAS):  # noqa: N802
+        with capture_writes(using) as writes:
+            yield writes
+        self.assertEqual(
+            len(writes), number,
+            f"Выполнено {len(writes)} изменяющих запросов вместо {number}:\n"
+            + "\n".join(writes),
+        )
@@ -0,0 +1,1042 @@
+import base64
+import json
+import os
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import token_cache
+from api.cache import object_version_key
+from api.shopping_list_cache import shopping_list_cache
+from api.testing import BudgetTestMixin, get_api_routes
+from foodgram.asgi import application
+from foodgram.db_router import replica_pool
+from recipes.images import process_recipe_image
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, User)
+from users.models import Subscribe
+
+
+class APIDataMixin:
+    """Общие данные тестов: пользователи, теги, ингредиенты и рецепты.
+
+    Общий кеш между тестами очищается: в нём лежат версии и
+    представления объектов с теми же id.
+    """
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.users = [
+            User.objects.create(
+                username=f"user{index}", email=f"user{index}@example.com",
+                first_name="Имя", last_name="Фамилия",
+            )
+            for index in range(4)
+        ]
+        self.tags = [
+            Tag.objects.create(name=f"Тег {index}", color=f"#00000{index}",
+                               slug=f"tag{index}")
+            for index in range(3)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=f"Ингредиент {index}",
+                                      measurement_unit="г")
+            for index in range(6)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def create_recipes(self, number, **fields):
+        recipes = []
+        for index in range(number):
+            recipe = Recipe.objects.create(
+                name=f"Рецепт {index}", text="Описание", cooking_time=10,
+                author=self.users[index % len(self.users)],
+                image="recipes/image.png", **fields,
+            )
+            recipe.tags.set(self.tags[:index % len(self.tags) + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=self.ingredients[
+                        (index + shift) % len(self.ingredients)],
+                    amount=shift + 1,
+                )
+                for shift in range(3)
+            )
+            recipes.append(recipe)
+        return recipes
+
+    def get_pages(self, url):
+        """Страницы курсорной выдачи по ссылкам `next`; ни один запрос
+        не должен использовать OFFSET.
+        """
+        pages = []
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                pages.append(response.data)
+                url = response.data["next"]
+        for query in context.captured_queries:
+            self.assertNotIn("OFFSET", query["sql"].upper())
+        return pages
+
+    def get_ids(self, pages):
+        return [recipe["id"] for page in pages for recipe in page["results"]]
+
+
+class APITestCase(APIDataMixin, BudgetTestMixin, TestCase):
+    pass
+
+
+class RecipeListQueriesTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_recipes(12)
+        for author in self.users[1:3]:
+            Subscribe.objects.create(user=self.users[0], author=author)
+
+    def get_list(self, limit):
+        cache.clear()
+        return self.client.get("/api/recipes/", {"limit": limit})
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        # Число, id страницы, рецепты, авторы, теги, ингредиенты
+        # и отметки пользователя.
+        for limit in (1, 10):
+            with self.subTest(limit=limit), self.assertNumQueries(7):
+                response = self.get_list(limit)
+                self.assertEqual(len(response.data["results"]), limit)
+                self.assertWithinBudget(response)
+
+    def test_detail_queries(self):
+        recipe = Recipe.objects.first()
+        with self.assertNumQueries(5):
+            response = self.client.get(f"/api/recipes/{recipe.id}/")
+        self.assertEqual(response.data["id"], recipe.id)
+        self.assertWithinBudget(response)
+
+
+class RecipeCursorPaginationTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = self.create_recipes(14)
+        # Как после заполнения pub_date миграцией: у всех одно значение.
+        Recipe.objects.update(pub_date=timezone.now())
+
+    def test_pages_through_tied_rows_by_key(self):
+        pages = self.get_pages("/api/recipes/?cursor=&limit=4")
+        self.assertEqual([len(page["results"]) for page in pages],
+                         [4, 4, 4, 2])
+        self.assertEqual(
+            self.get_ids(pages),
+            sorted((recipe.id for recipe in self.recipes), reverse=True),
+        )
+
+    def test_previous_link_returns_to_previous_page(self):
+        pages = self.get_pages("/api/recipes/?cursor=&limit=4")
+        self.assertIsNone(pages[0]["previous"])
+        response = self.client.get(pages[2]["previous"])
+        self.assertEqual(response.data["results"], pages[1]["results"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/recipes/", {"cursor": "bz0z"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_is_ordered_by_date(self):
+        # Совпадение в названии весит больше, чем в описании.
+        titled, described = self.recipes[:2]
+        Recipe.objects.filter(pk=titled.pk).update(name="Борщ")
+        Recipe.objects.filter(pk=described.pk).update(text="Как борщ")
+        response = self.client.get("/api/recipes/", {"search": "борщ"})
+        self.assertEqual(self.get_ids([response.data]),
+                         [titled.id, described.id])
+        pages = self.get_pages("/api/recipes/?" + urlencode(
+            {"search": "борщ", "cursor": "", "limit": 1}))
+        self.assertEqual(self.get_ids(pages), [described.id, titled.id])
+
+
+class FeedTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = self.create_recipes(16)
+        Recipe.objects.update(pub_date=timezone.now())
+
+    def subscribe(self, *authors):
+        for author in authors:
+            response = self.client.post(f"/api/users/{author.id}/subscribe/")
+            self.assertEqual(response.status_code, 201)
+
+    def get_expected_ids(self, authors):
+        return sorted(
+            (recipe.id for recipe in self.recipes if recipe.author in authors),
+            reverse=True,
+        )
+
+    def test_pages_through_tied_entries_by_key(self):
+        authors = self.users[1:]
+        self.subscribe(*authors)
+        self.assertEqual(FeedEntry.objects.filter(user=self.users[0]).count(),
+                         12)
+        pages = self.get_pages("/api/recipes/feed/?cursor=&limit=5")
+        self.assertEqual(self.get_ids(pages), self.get_expected_ids(authors))
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_large_authors_are_merged_at_read(self):
+        large, small = self.users[1], self.users[2]
+        Subscribe.objects.create(user=self.users[3], author=large)
+        self.subscribe(large, small)
+        large.refresh_from_db()
+        self.assertTrue(large.is_large_author)
+        self.assertFalse(
+            FeedEntry.objects.filter(author=large).exists())
+
+        recipe = self.create_recipes(1)[0]
+        Recipe.objects.filter(pk=recipe.pk).update(author=large)
+        recipe.refresh_from_db()
+        FeedEntry.objects.publish(recipe)
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        self.recipes.append(recipe)
+
+        pages = self.get_pages("/api/recipes/feed/?cursor=&limit=5")
+        self.assertEqual(self.get_ids(pages),
+                         self.get_expected_ids((large, small)))
+
+    def test_new_recipe_is_fanned_out_to_followers(self):
+        author = self.users[1]
+        self.subscribe(author)
+        Subscribe.objects.create(user=self.users[2], author=author)
+        client = APIClient()
+        client.force_authenticate(author)
+        response = client.post("/api/recipes/", {
+            "ingredients": [{"id": self.ingredients[0].id, "amount": 1}],
+            "tags": [self.tags[0].id],
+            "name": "Новый рецепт",
+            "text": "Описание",
+            "cooking_time": 10,
+        }, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(
+                recipe_id=response.data["id"]
+            ).values_list("user_id", flat=True)),
+            {self.users[0].id, self.users[2].id},
+        )
+        response = self.client.get("/api/recipes/feed/")
+        self.assertEqual(response.data["results"][0]["name"], "Новый рецепт")
+
+    def test_unfollow_removes_entries(self):
+        author = self.users[1]
+        self.subscribe(author, self.users[2])
+        response = self.client.delete(f"/api/users/{author.id}/subscribe/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FeedEntry.objects.filter(author=author).exists())
+        pages = self.get_pages("/api/recipes/feed/?cursor=&limit=5")
+        self.assertEqual(self.get_ids(pages),
+                         self.get_expected_ids((self.users[2],)))
+
+    def test_rebuild_fans_out_former_large_author(self):
+        author = self.users[1]
+        with self.settings(FEED_FANOUT_LIMIT=1):
+            Subscribe.objects.create(user=self.users[3], author=author)
+            self.subscribe(author)
+        author.refresh_from_db()
+        self.assertTrue(author.is_large_author)
+
+        Subscribe.objects.filter(user=self.users[3]).delete()
+        FeedEntry.objects.rebuild()
+        author.refresh_from_db()
+        self.assertFalse(author.is_large_author)
+        self.assertEqual(
+            list(FeedEntry.objects.filter(
+                user=self.users[0]
+            ).order_by("-recipe_id").values_list("recipe_id", flat=True)),
+            self.get_expected_ids((author,)),
+        )
+
+
+class CounterOrderingCursorTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = self.create_recipes(12)
+        # Большинство счётчиков равны нулю.
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in self.recipes[:3]]
+        ).update(favorites_count=2)
+
+    def test_pages_through_tied_counters_by_key(self):
+        for ordering in ("-favorites_count", "favorites_count"):
+            with self.subTest(ordering=ordering):
+                pages = self.get_pages(
+                    f"/api/recipes/?cursor=&limit=5&ordering={ordering}")
+                self.assertEqual(
+                    self.get_ids(pages),
+                    list(Recipe.objects.order_by(
+                        ordering, ordering.replace("favorites_count", "id")
+                    ).values_list("id", flat=True)),
+                )
+
+
+class RequestBudgetTest(SimpleTestCase):
+    def test_every_route_has_budget(self):
+        missing = [
+            (name, method)
+            for name, methods in sorted(get_api_routes().items())
+            for method in sorted(methods)
+            if (name, method) not in settings.REQUEST_BUDGETS
+        ]
+        self.assertEqual(missing, [])
+
+
+class RecipeWriteTest(APITestCase):
+    def get_data(self, **fields):
+        return {
+            "ingredients": [
+                {"id": ingredient.id, "amount": 5}
+                for ingredient in self.ingredients[:4]
+            ],
+            "tags": [tag.id for tag in self.tags[:2]],
+            "name": "Рецепт",
+            "text": "Описание",
+            "cooking_time": 10,
+            **fields,
+        }
+
+    def test_writes_are_checked_against_their_own_budgets(self):
+        response = self.client.post(
+            "/api/recipes/", self.get_data(), format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.budget_key, ("recipes-list", "POST"))
+        self.assertWithinBudget(response)
+        url = f"/api/recipes/{response.data['id']}/"
+
+        response = self.client.patch(
+            url, self.get_data(name="Новое название"), format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinBudget(response)
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertWithinBudget(response)
+
+    def test_ingredient_edit_of_carted_recipe_is_within_budget(self):
+        recipe = self.create_recipes(1)[0]
+        for user in self.users[:3]:
+            client = APIClient()
+            client.force_authenticate(user)
+            client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+        response = self.client.patch(f"/api/recipes/{recipe.id}/", {
+            "ingredients": [
+                {"id": self.ingredients[0].id, "amount": 9},
+                {"id": self.ingredients[1].id, "amount": 2},
+                {"id": self.ingredients[5].id, "amount": 3},
+            ],
+            "tags": [self.tags[1].id, self.tags[2].id],
+            "name": "Новое название",
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinBudget(response)
+
+    def test_unknown_ids_are_listed_in_one_error(self):
+        data = self.get_data(tags=[self.tags[0].id, 998, 999])
+        data["ingredients"] += [{"id": 997, "amount": 1}]
+        response = self.client.post("/api/recipes/", data, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["tags"],
+                         ["Теги с id 998, 999 не найдены."])
+        self.assertEqual(response.data["ingredients"],
+                         ["Ингредиенты с id 997 не найдены."])
+
+
+class RecipeImageTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = override_settings(MEDIA_ROOT=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        patcher = mock.patch("recipes.images.executor", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_image(self, color):
+        buffer = BytesIO()
+        Image.new("RGB", (600, 400), color).save(buffer, "PNG")
+        return ("data:image/png;base64,"
+                + base64.b64encode(buffer.getvalue()).decode())
+
+    def post_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/recipes/", {
+                "ingredients": [{"id": self.ingredients[0].id, "amount": 1}],
+                "tags": [self.tags[0].id],
+                "image": self.get_image("red"),
+                "name": "Рецепт",
+                "text": "Описание",
+                "cooking_time": 10,
+            }, format="json")
+        self.assertEqual(response.status_code, 201)
+        return response, Recipe.objects.get(pk=response.data["id"])
+
+    def test_processed_image_keeps_returned_url(self):
+        response, recipe = self.post_recipe()
+        self.assertTrue(response.data["image"].endswith(recipe.image.url))
+        self.assertTrue(default_storage.exists(recipe.image.name))
+        for field in (recipe.image_card, recipe.image_detail):
+            self.assertTrue(default_storage.exists(field.name))
+        self.assertEqual(
+            len(default_storage.listdir("recipes/")[1]), 1)
+
+    def test_reprocessing_overwrites_files(self):
+        _, recipe = self.post_recipe()
+        names = (recipe.image.name, recipe.image_card.name,
+                 recipe.image_detail.name)
+        process_recipe_image(recipe.id)
+        recipe.refresh_from_db()
+        self.assertEqual((recipe.image.name, recipe.image_card.name,
+                          recipe.image_detail.name), names)
+        for name in names:
+            self.assertTrue(default_storage.exists(name))
+
+
+class RecipeRepresentationTest(APITestCase):
+    def test_write_response_matches_read(self):
+        recipe = self.create_recipes(1)[0]
+        url = f"/api/recipes/{recipe.id}/"
+        for action in ("favorite", "shopping_cart"):
+            self.client.post(f"{url}{action}/")
+        response = self.client.patch(url, {
+            "ingredients": [{"id": self.ingredients[0].id, "amount": 2}],
+            "tags": [self.tags[0].id],
+            "name": recipe.name,
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data["is_favorited"])
+        self.assertTrue(response.data["is_in_shopping_cart"])
+        self.assertFalse(response.data["author"]["is_subscribed"])
+        cache.clear()
+        self.assertEqual(self.client.get(url).data, response.data)
+
+    @override_settings(OBJECT_VERSION_TIMEOUT=1)
+    def test_unknown_recipe_version_expires(self):
+        response = self.client.get("/api/recipes/999/")
+        self.assertEqual(response.status_code, 404)
+        key = object_version_key(Recipe, 999)
+        self.assertIsNotNone(cache.get(key))
+        time.sleep(1.1)
+        self.assertIsNone(cache.get(key))
+
+
+class RecipeIngredientDiffTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipes(1)[0]
+        self.url = f"/api/recipes/{self.recipe.id}/"
+        self.amounts = dict(
+            self.recipe.recipe_ingredients.values_list(
+                "ingredient_id", "amount")
+        )
+
+    def patch(self, amounts):
+        response = self.client.patch(self.url, {
+            "ingredients": [
+                {"id": ingredient_id, "amount": amount}
+                for ingredient_id, amount in amounts.items()
+            ],
+            "tags": list(self.recipe.tags.values_list("id", flat=True)),
+            "name": self.recipe.name,
+            "text": self.recipe.text,
+            "cooking_time": self.recipe.cooking_time,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(self.recipe.recipe_ingredients.values_list(
+                "ingredient_id", "amount")),
+            amounts,
+        )
+
+    def test_unchanged_ingredients_are_not_written(self):
+        with self.assertNumWrites(0):
+            self.patch(self.amounts)
+
+    def test_changed_amount_is_one_update(self):
+        ingredient_id = next(iter(self.amounts))
+        with self.assertNumWrites(1) as writes:
+            self.patch({**self.amounts, ingredient_id: 50})
+        self.assertTrue(writes[0].startswith("UPDATE"))
+
+    def test_added_ingredient_is_one_insert(self):
+        ingredient = next(
+            ingredient for ingredient in self.ingredients
+            if ingredient.id not in self.amounts
+        )
+        with self.assertNumWrites(1) as writes:
+            self.patch({**self.amounts, ingredient.id: 7})
+        self.assertTrue(writes[0].startswith("INSERT"))
+
+    def test_removed_ingredient_is_one_delete(self):
+        amounts = dict(list(self.amounts.items())[1:])
+        with self.assertNumWrites(1) as writes:
+            self.patch(amounts)
+        self.assertTrue(writes[0].startswith("DELETE"))
+
+
+class ToggleTest(APITestCase):
+    """Повторное добавление и удаление — один запрос, который ничего
+    не меняет, и ответ 400.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipes(2)[1]
+
+    def check_recipe_toggle(self, action, model, counter, errors):
+        url = f"/api/recipes/{self.recipe.id}/{action}/"
+        rows = model.objects.filter(user=self.users[0], recipe=self.recipe)
+        self.assertEqual(self.client.post(url).status_code, 201)
+        with self.assertNumWrites(1):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"], errors[0])
+        self.assertEqual(rows.count(), 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), 1)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        with self.assertNumWrites(1):
+            response = self.client.delete(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"], errors[1])
+        self.assertFalse(rows.exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, counter), 0)
+
+    def test_favorite(self):
+        self.check_recipe_toggle(
+            "favorite", Favorite, "favorites_count",
+            ("Рецепт уже в избранном.", "Рецепта нет в избранном."),
+        )
+
+    def test_shopping_cart(self):
+        self.check_recipe_toggle(
+            "shopping_cart", ShoppingCart, "in_carts_count",
+            ("Рецепт уже находится в списке покупок.",
+             "Рецепта нет в списке покупок."),
+        )
+
+    def test_unknown_recipe(self):
+        for action in ("favorite", "shopping_cart"):
+            response = self.client.post(f"/api/recipes/999/{action}/")
+            self.assertEqual(response.status_code, 404)
+
+    def test_subscribe(self):
+        url = f"/api/users/{self.users[1].id}/subscribe/"
+        subscriptions = Subscribe.objects.filter(user=self.users[0])
+        self.assertEqual(self.client.post(url).status_code, 201)
+        with self.assertNumWrites(1):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"],
+                         "Вы уже подписаны на этого автора.")
+        self.assertEqual(subscriptions.count(), 1)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertFalse(subscriptions.exists())
+
+    def test_subscribe_to_self(self):
+        response = self.client.post(
+            f"/api/users/{self.users[0].id}/subscribe/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"],
+                         "Нельзя подписаться на самого себя.")
+        self.assertFalse(Subscribe.objects.exists())
+
+
+class BatchTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipes = self.create_recipes(3)
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def send(self, method, url, ids):
+        response = getattr(self.client, method)(url, {"ids": ids},
+                                                format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinBudget(response)
+        return [
+            (result["id"], result["status"])
+            for result in response.data["results"]
+        ]
+
+    def get_counters(self, counter):
+        return list(Recipe.objects.filter(pk__in=self.ids).order_by(
+            "id").values_list(counter, flat=True))
+
+    def test_shopping_cart_batch(self):
+        url = "/api/recipes/shopping_cart/batch/"
+        first, second, third = self.ids
+        self.client.post(f"/api/recipes/{first}/shopping_cart/")
+        self.assertEqual(
+            self.send("post", url, [first, second, 999, second, third]),
+            [(first, "exists"), (second, "created"), (999, "not_found"),
+             (third, "created")],
+        )
+        self.assertEqual(self.get_counters("in_carts_count"), [1, 1, 1])
+        self.assertEqual(
+            {(item.user_id, item.ingredient_id): item.amount
+             for item in ShoppingListItem.objects.all()},
+            ShoppingListItem.objects.calculate(),
+        )
+
+        self.assertEqual(
+            self.send("delete", url, [first, 999, third]),
+            [(first, "deleted"), (999, "absent"), (third, "deleted")],
+        )
+        self.assertEqual(self.get_counters("in_carts_count"), [0, 1, 0])
+        self.assertEqual(
+            ShoppingListItem.objects.calculate(),
+            {(self.users[0].id, ingredient.id): amount
+             for ingredient, amount in zip(self.ingredients[1:4], (1, 2, 3))},
+        )
+
+    def test_favorite_batch(self):
+        url = "/api/recipes/favorite/batch/"
+        self.assertEqual(
+            self.send("post", url, self.ids),
+            [(recipe_id, "created") for recipe_id in self.ids],
+        )
+        self.assertEqual(self.get_counters("favorites_count"), [1, 1, 1])
+        self.assertEqual(
+            self.send("delete", url, self.ids[:1]),
+            [(self.ids[0], "deleted")],
+        )
+        self.assertEqual(self.get_counters("favorites_count"), [0, 1, 1])
+
+    def test_subscribe_batch(self):
+        url = "/api/users/subscribe/batch/"
+        me, author = self.users[:2]
+        self.assertEqual(
+            self.send("post", url, [me.id, author.id, 999]),
+            [(me.id, "invalid"), (author.id, "created"), (999, "not_found")],
+        )
+        self.assertEqual(
+            list(Subscribe.objects.filter(user=me).values_list(
+                "author_id", flat=True)),
+            [author.id],
+        )
+        self.assertTrue(FeedEntry.objects.filter(
+            user=me, author=author).exists())
+        self.assertEqual(
+            self.send("delete", url, [author.id]),
+            [(author.id, "deleted")],
+        )
+        self.assertFalse(FeedEntry.objects.filter(user=me).exists())
+
+    def test_invalid_ids(self):
+        for ids in ([], [1, "a"], [0], "1"):
+            response = self.client.post(
+                "/api/recipes/favorite/batch/", {"ids": ids}, format="json")
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
+
+
+class ShoppingListTest(APITestCase):
+    """Списки покупок меняются на разницу и совпадают с пересчётом
+    из корзин.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = self.create_recipes(3)
+        self.other_client = APIClient()
+        self.other_client.force_authenticate(self.users[1])
+        for client in (self.client, self.other_client):
+            for recipe in self.recipes[:2]:
+                response = client.post(
+                    f"/api/recipes/{recipe.id}/shopping_cart/")
+                self.assertEqual(response.status_code, 201)
+
+    def get_items(self):
+        return {
+            (item.user_id, item.ingredient_id): item.amount
+            for item in ShoppingListItem.objects.all()
+        }
+
+    def assertShoppingListsRebuilt(self):  # noqa: N802
+        self.assertEqual(self.get_items(),
+                         ShoppingListItem.objects.calculate())
+
+    def test_cart_toggles_add_and_subtract_amounts(self):
+        ingredients = self.ingredients
+        self.assertEqual(self.get_items(), {
+            (user.id, ingredient.id): amount
+            for user in self.users[:2]
+            for ingredient, amount in (
+                (ingredients[0], 1), (ingredients[1], 3),
+                (ingredients[2], 5), (ingredients[3], 3),
+            )
+        })
+        response = self.client.delete(
+            f"/api/recipes/{self.recipes[0].id}/shopping_cart/")
+        self.assertEqual(response.status_code, 204)
+        self.assertShoppingListsRebuilt()
+        self.assertNotIn((self.users[0].id, ingredients[0].id),
+                         self.get_items())
+
+    def test_ingredient_edit_changes_every_cart(self):
+        recipe = self.recipes[0]
+        response = self.client.patch(f"/api/recipes/{recipe.id}/", {
+            "ingredients": [
+                {"id": self.ingredients[0].id, "amount": 10},
+                {"id": self.ingredients[5].id, "amount": 4},
+            ],
+            "tags": [self.tags[0].id],
+            "name": recipe.name,
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+        }, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertShoppingListsRebuilt()
+        for user in self.users[:2]:
+            self.assertEqual(
+                self.get_items()[(user.id, self.ingredients[5].id)], 4)
+
+    def test_recipe_delete_subtracts_from_every_cart(self):
+        response = self.client.delete(
+            f"/api/recipes/{self.recipes[0].id}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertShoppingListsRebuilt()
+        self.assertEqual(len(self.get_items()), 6)
+
+
+class TokenCacheTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.users[1]
+        self.user.set_password("Пароль-12345")
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def get_me(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/api/users/me/")
+        token_queries = [
+            query for query in context.captured_queries
+            if Token._meta.db_table in query["sql"]
+        ]
+        return response, token_queries
+
+    def test_known_token_is_served_from_cache(self):
+        response, token_queries = self.get_me()
+        self.assertEqual(response.data["id"], self.user.id)
+        self.assertEqual(len(token_queries), 1)
+        response, token_queries = self.get_me()
+        self.assertEqual(response.data["id"], self.user.id)
+        self.assertEqual(token_queries, [])
+        self.assertEqual(token_cache.get_stats()["local_hits"], 1)
+
+    def test_logout_invalidates_token(self):
+        self.get_me()
+        response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(token_cache.get(self.token.key))
+        response, _ = self.get_me()
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_invalidates_token(self):
+        self.get_me()
+        response = self.client.post("/api/users/set_password/", {
+            "current_password": "Пароль-12345",
+            "new_password": "Новый-пароль-67890",
+        })
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(token_cache.get(self.token.key))
+        _, token_queries = self.get_me()
+        self.assertEqual(len(token_queries), 1)
+
+    def test_deactivation_invalidates_token(self):
+        self.get_me()
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.get_me()
+        self.assertEqual(response.status_code, 401)
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    url = "/api/recipes/download_shopping_cart/"
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = override_settings(SHOPPING_LIST_CACHE_DIR=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.directory = Path(directory.name)
+        self.recipes = self.create_recipes(3)
+        for recipe in self.recipes[:2]:
+            self.client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+
+    def download(self, client=None, etag=None, **params):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return (client or self.client).get(self.url, params, **headers)
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_unsupported_accept_falls_back_to_text(self):
+        response = self.client.get(self.url, HTTP_ACCEPT="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"],
+                         "text/plain; charset=utf-8")
+        self.assertIn("Ингредиент 0", b"".join(
+            response.streaming_content).decode())
+
+    def test_format_parameter_selects_renderer(self):
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"],
+                         "attachment; filename=shopping-list.csv")
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.download()
+        etag = response["ETag"]
+        self.get_content(response)
+        response = self.download(etag=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertNotEqual(self.download(etag=etag, format="csv")["ETag"],
+                            etag)
+
+        self.client.post(
+            f"/api/recipes/{self.recipes[2].id}/shopping_cart/")
+        response = self.download(etag=etag)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Ингредиент 4", self.get_content(response))
+
+    def test_recipe_edit_changes_file(self):
+        etag = self.download()["ETag"]
+        recipe = self.recipes[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/recipes/{recipe.id}/", {
+                "ingredients": [{"id": self.ingredients[5].id, "amount": 7}],
+                "tags": [self.tags[0].id],
+                "name": recipe.name,
+                "text": recipe.text,
+                "cooking_time": recipe.cooking_time,
+            }, format="json")
+        response = self.download(etag=etag)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn("Ингредиент 5, 7 г", self.get_content(response))
+
+    def test_identical_carts_share_file(self):
+        client = APIClient()
+        client.force_authenticate(self.users[1])
+        for recipe in self.recipes[:2]:
+            client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+        first, second = self.download(), self.download(client)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual(self.get_content(first), self.get_content(second))
+        self.assertEqual(len(list(self.directory.iterdir())), 1)
+
+    def test_prune_removes_expired_and_oldest_files(self):
+        for shopping_format in ("txt", "csv", "pdf"):
+            response = self.download(format=shopping_format)
+            self.assertEqual(response.status_code, 200)
+            response.close()
+        paths = {path.suffix: path for path in self.directory.iterdir()}
+        now = time.time()
+        os.utime(paths[".pdf"], (now - 100, now - 100))
+        os.utime(paths[".txt"], (now - 10, now - 10))
+        with self.settings(
+            SHOPPING_LIST_CACHE_MAX_AGE=50,
+            SHOPPING_LIST_CACHE_MAX_SIZE=paths[".csv"].stat().st_size,
+        ):
+            self.assertEqual(shopping_list_cache.prune(), 2)
+        self.assertEqual(list(self.directory.iterdir()), [paths[".csv"]])
+
+
+class AsgiTest(APIDataMixin, TransactionTestCase):
+    """Ответы под ASGI: представления работают в пуле потоков, поэтому
+    данные должны быть зафиксированы.
+    """
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overridden = override_settings(SHOPPING_LIST_CACHE_DIR=directory.name)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.token = Token.objects.create(user=self.users[0])
+        for recipe in self.create_recipes(12):
+            self.client.post(f"/api/recipes/{recipe.id}/shopping_cart/")
+
+    async def fetch(self, path, query_string=b""):
+        communicator = ApplicationCommunicator(application, {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query_string,
+            "headers": [
+                (b"host", b"testserver"),
+                (b"authorization", f"Token {self.token.key}".encode()),
+            ],
+        })
+        await communicator.send_input({"type": "http.request"})
+        start = await communicator.receive_output(5)
+        bodies = []
+        while True:
+            message = await communicator.receive_output(5)
+            bodies.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return start, bodies
+
+    def test_async_route_matches_sync_response(self):
+        start, bodies = async_to_sync(self.fetch)("/api/recipes/")
+        self.assertEqual(start["status"], 200)
+        self.assertEqual(
+            json.loads(b"".join(bodies)),
+            json.loads(self.client.get("/api/recipes/").content),
+        )
+
+    @mock.patch.object(application, "chunk_size", 64)
+    def test_file_is_streamed_in_chunks(self):
+        start, bodies = async_to_sync(self.fetch)(
+            "/api/recipes/download_shopping_cart/", b"format=csv")
+        self.assertEqual(start["status"], 200)
+        self.assertGreater(len(bodies), 2)
+        response = self.client.get(
+            "/api/recipes/download_shopping_cart/", {"format": "csv"})
+        self.assertEqual(b"".join(bodies),
+                         b"".join(response.streaming_content))
+
+
+def add_test_replica(alias):
+    """Регистрирует и создаёт отдельную пустую базу в роли реплики.
+
+    Данных основной базы в ней нет, поэтому по ответу видно, откуда
+    было чтение.
+    """
+    default = connections.settings[DEFAULT_DB_ALIAS]
+    connections.settings[alias] = {
+        **default,
+        "TEST": {
+            "NAME": (
+                None if default["ENGINE"].endswith("sqlite3")
+                else f"test_{default['NAME']}_{alias}"
+            ),
+        },
+    }
+    connections[alias].creation.create_test_db(verbosity=0, autoclobber=True,
+                                               serialize=False)
+
+
+def remove_test_replica(alias):
+    connections[alias].creation.destroy_test_db(verbosity=0)
+    del connections[alias]
+    del connections.settings[alias]
+
+
+REPLICA = "replica_test"
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=1)
+class ReplicaRoutingTest(TransactionTestCase):
+    """Чтение из реплики и возврат к основной базе.
+
+    Внутри транзакции чтение всегда идёт в основную базу, поэтому тест
+    работает без обёртки TestCase. Реплика существует только на время
+    этих тестов, и запуск тестов о ней не знает.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        add_test_replica(REPLICA)
+        cls.databases = {DEFAULT_DB_ALIAS, REPLICA}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        del cls.databases
+        remove_test_replica(REPLICA)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        replica_pool.reset()
+        self.user = User.objects.create(username="reader",
+                                        email="reader@example.com")
+        self.recipe = Recipe.objects.create(
+            name="Рецепт", text="Описание", cooking_time=10,
+            author=self.user, image="recipes/image.png",
+        )
+        self.client = self.get_client(self.user)
+
+    def get_client(self, user):
+        client = APIClient()
+        token = Token.objects.create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+        return client
+
+    def get_count(self, client):
+        response = client.get("/api/recipes/")
+        self.assertEqual(response.status_code, 200)
+        return response.data["count"]
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.get_count(self.client), 0)
+        self.assertEqual(
+            self.client.get(f"/api/users/{self.user.id}/").status_code, 404)
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post(f"/api/recipes/{self.recipe.id}/favorite/")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_count(self.client), 1)
+        # Другие клиенты по-прежнему читают из реплики.
+        other = User.objects.create(username="other",
+                                    email="other@example.com")
+        self.assertEqual(self.get_count(self.get_client(other)), 0)
+
+        time.sleep(settings.REPLICA_STICKY_SECONDS + 0.1)
+        self.assertEqual(self.get_count(self.client), 0)
+
+    def test_failed_write_does_not_stick(self):
+        response = self.client.post("/api/recipes/0/favorite/")
+        self.assertGreaterEqual(response.status_code, 400)
+        self.assertEqual(self.get_count(self.client), 0)
+
+    def test_unhealthy_replica_is_skipped(self):
+        with mock.patch.object(replica_pool, "check", return_value=False):
+            self.assertEqual(self.get_count(self.client), 1)
@@ -2,8 +2,9 @@ from django.urls import include, path
 from rest_framework import routers
 
 from api.views import (CustomUserViewSet, RecipeViewSet,
-                       TagViewsSet, IngredientViewSet,
-                       SubscribeViewSet, ShoppingCartViewSet, FavoriteViewSet)
+                       TagViewsSet, IngredientViewSet, SubscribeViewSet,
+                       ShoppingCartViewSet, FavoriteViewSet,
+                       TokenCacheStatsView)
 
 router = routers.DefaultRouter()
 router.register(r"users", CustomUserViewSet, basename="users")
@@ -12,26 +13,57 @@ router.register("recipes", RecipeViewSet, basename="recipes")
 router.register("ingredients", IngredientViewSet, basename="ingredients")
 
 urlpatterns = [
+    path(
+        "recipes/shopping_cart/batch/",
+        ShoppingCartViewSet.as_view(
+            {"post": "shopping_cart_batch", "delete": "shopping_cart_batch"}
+        ),
+        name="shopping-cart-batch",
+    ),
+    path(
+        "recipes/favorite/batch/",
+        FavoriteViewSet.as_view(
+            {"post": "favorite_batch", "delete": "favorite_batch"}
+        ),
+        name="favorite-batch",
+    ),
+    path(
+        "users/subscribe/batch/",
+        SubscribeViewSet.as_view(
+            {"post": "subscribe_batch", "delete": "subscribe_batch"}
+        ),
+        name="subscribe-batch",
+    ),
     path(
         "recipes/<int:pk>/shopping_cart/",
         ShoppingCartViewSet.as_view(
             {"post": "shopping_cart", "delete": "shopping_cart"}
         ),
+        name="shopping-cart",
     ),
     path(
         "recipes/download_shopping_cart/",
-        ShoppingCartViewSet.as_view({"get": "download_shopping_cart"}),
+        ShoppingCartViewSet.as_view(
+            {"get": "download_shopping_cart"},
+            **ShoppingCartViewSet.download_shopping_cart.kwargs,
+        ),
+        name="download-shopping-cart",
     ),
     path(
         "recipes/<int:pk>/favorite/",
         FavoriteViewSet.as_view({"post": "favorite", "delete": "favorite"}),
+        name="favorite",
     ),
     path("users/subscriptions/",
-         SubscribeViewSet.as_view({"get": "subscriptions"})),
+         SubscribeViewSet.as_view({"get": "subscriptions"}),
+         name="subscriptions"),
     path(
         "users/<int:pk>/subscribe/",
         SubscribeViewSet.as_view({"post": "subscribe", "delete": "subscribe"}),
+        name="subscribe",
     ),
     path("", include(router.urls)),
+    path("auth/token/cache/", TokenCacheStatsView.as_view(),
+         name="token-cache"),
     path("auth/", include("djoser.urls.authtoken")),
 ]
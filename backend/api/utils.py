@@ -1,31 +1,186 @@
-from django.db.models import Sum
+from django.db import connections, router
+from django.db.models import CharField, Exists, F, OuterRef, Subquery, Value
 
-from recipes.models import RecipeIngredient, Ingredient
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from users.models import Subscribe
 
 
 def get_ingredients_shopping_cart(user):
     ingredients = (
-        RecipeIngredient.objects.filter(recipe__shopping_list__user=user)
+        ShoppingListItem.objects.filter(user=user)
         .order_by("ingredient__name")
-        .values("ingredient__name", "ingredient__measurement_unit")
-        .annotate(total_amount=Sum("amount"))
+        .values("ingredient__name", "ingredient__measurement_unit",
+                total_amount=F("amount"))
     )
 
     return ingredients
 
 
-def create_shopping_cart(buy_list):
-    ingredient_ids = [item["ingredient"] for item in buy_list]
-    ingredients = Ingredient.objects.filter(id__in=ingredient_ids)
+def get_recipes_preview(recipes_limit=None):
+    """Рецепты авторов для превью в подписках.
 
-    ingredient_dict = {ingredient.id: ingredient for ingredient in ingredients}
+    Лимит применяется к каждому автору отдельно внутри одного запроса:
+    коррелированный подзапрос выбирает первые `recipes_limit` рецептов
+    автора, поэтому страница подписок загружается одним запросом.
+    """
+    recipes = Recipe.objects.only(
+        "id", "name", "image", "image_card", "cooking_time", "author_id"
+    ).order_by("-id")
+    try:
+        recipes_limit = int(recipes_limit)
+    except (TypeError, ValueError):
+        return recipes
+    if recipes_limit < 0:
+        return recipes
+    latest = Recipe.objects.filter(
+        author_id=OuterRef("author_id")
+    ).order_by("-id").values("id")[:recipes_limit]
+    return recipes.filter(id__in=Subquery(latest))
 
-    buy_list_text = "Список покупок с сайта Foodgram:\n\n"
-    for item in buy_list:
-        ingredient_id = item["ingredient"]
-        ingredient = ingredient_dict.get(ingredient_id)
-        amount = item["amount"]
-        buy_list_text += (
-            f"{ingredient.name}, {amount} " f"{ingredient.measurement_unit}\n"
+
+def get_memberships(user, recipe_ids, author_ids):
+    """Избранное, корзина и подписки пользователя одним запросом."""
+    memberships = {"favorite": set(), "cart": set(), "subscribe": set()}
+    if user.is_anonymous or not recipe_ids:
+        return memberships
+    rows = Favorite.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).annotate(
+        kind=Value("favorite", output_field=CharField())
+    ).values_list("kind", "recipe_id").order_by().union(
+        ShoppingCart.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).annotate(
+            kind=Value("cart", output_field=CharField())
+        ).values_list("kind", "recipe_id").order_by(),
+        Subscribe.objects.filter(
+            user=user, author_id__in=author_ids
+        ).annotate(
+            kind=Value("subscribe", output_field=CharField())
+        ).values_list("kind", "author_id").order_by(),
+        all=True,
+    )
+    for kind, object_id in rows:
+        memberships[kind].add(object_id)
+    return memberships
+
+
+def apply_memberships(recipes, user):
+    """Представления рецептов с `is_favorited`, `is_in_shopping_cart`
+    и `author.is_subscribed` пользователя.
+    """
+    memberships = get_memberships(
+        user,
+        [recipe["id"] for recipe in recipes],
+        {recipe["author"]["id"] for recipe in recipes},
+    )
+    return [
+        {
+            **recipe,
+            "author": {
+                **recipe["author"],
+                "is_subscribed":
+                    recipe["author"]["id"] in memberships["subscribe"],
+            },
+            "is_favorited": recipe["id"] in memberships["favorite"],
+            "is_in_shopping_cart": recipe["id"] in memberships["cart"],
+        }
+        for recipe in recipes
+    ]
+
+
+def insert_ignore(model, **values):
+    """Добавляет строку одним запросом INSERT ... ON CONFLICT DO NOTHING.
+
+    Возвращает True, если строка добавлена, и False, если такая запись
+    уже есть (нарушение ограничения уникальности).
+    """
+    return bool(insert_ignore_many(model, [values], model._meta.pk.name))
+
+
+def insert_ignore_many(model, rows, returning):
+    """Добавляет строки одним запросом INSERT ... ON CONFLICT DO NOTHING.
+
+    `rows` — словари с одинаковым набором полей. Возвращает значения поля
+    `returning` у добавленных строк; уже существующие строки пропускаются.
+    """
+    if not rows:
+        return []
+    opts = model._meta
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    names = list(rows[0])
+    columns = ", ".join(
+        quote_name(opts.get_field(name).column) for name in names)
+    row_placeholders = f"({', '.join(['%s'] * len(names))})"
+    params = [
+        getattr(row[name], "pk", row[name]) for row in rows for name in names
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote_name(opts.db_table)} ({columns}) "
+            f"VALUES {', '.join([row_placeholders] * len(rows))} "
+            f"ON CONFLICT DO NOTHING "
+            f"RETURNING {quote_name(opts.get_field(returning).column)}",
+            params,
         )
-    return buy_list_text
+        return [row[0] for row in cursor.fetchall()]
+
+
+BATCH_CREATED = "created"
+BATCH_EXISTS = "exists"
+BATCH_NOT_FOUND = "not_found"
+BATCH_DELETED = "deleted"
+BATCH_ABSENT = "absent"
+BATCH_INVALID = "invalid"
+
+
+def add_batch(model, field, user, ids, targets):
+    """Связывает пользователя с объектами `targets` из списка `ids`.
+
+    Существование объектов и уже имеющиеся связи проверяются одним
+    запросом, новые связи добавляются одним INSERT. Возвращает id
+    добавленных объектов и статусы по каждому id.
+    """
+    existing = dict(
+        targets.filter(pk__in=ids).annotate(
+            linked=Exists(model.objects.filter(
+                user=user, **{field: OuterRef("pk")}))
+        ).values_list("pk", "linked").order_by()
+    )
+    created = set(insert_ignore_many(
+        model,
+        [
+            {"user": user.id, field: object_id}
+            for object_id, linked in existing.items() if not linked
+        ],
+        field,
+    ))
+    statuses = {
+        object_id: (
+            BATCH_NOT_FOUND if object_id not in existing
+            else BATCH_CREATED if object_id in created
+            else BATCH_EXISTS
+        )
+        for object_id in ids
+    }
+    return created, statuses
+
+
+def remove_batch(model, field, user, ids):
+    """Удаляет связи пользователя с объектами из списка `ids`.
+
+    Связи блокируются до конца транзакции, поэтому параллельное удаление
+    тех же записей не учитывается дважды. Возвращает id объектов,
+    связи с которыми удалены, и статусы по каждому id.
+    """
+    links = model.objects.filter(user=user, **{f"{field}__in": ids})
+    deleted = set(
+        links.select_for_update().values_list(field, flat=True))
+    if deleted:
+        links.filter(**{f"{field}__in": deleted}).delete()
+    statuses = {
+        object_id: BATCH_DELETED if object_id in deleted else BATCH_ABSENT
+        for object_id in ids
+    }
+    return deleted, statuses
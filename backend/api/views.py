@@ -1,22 +1,35 @@
-from django.http import FileResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponseNotModified
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Exists, OuterRef, Sum
+from django.db.models import (BooleanField, Count, Exists, OuterRef,
+                              Prefetch, Q, Value, prefetch_related_objects)
 from djoser.views import UserViewSet
 
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import (
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
 
+from api.authentication import token_cache
+from api.cache import VersionedCacheMixin
 from api.filters import RecipeFilter
+from api.ingredient_index import ingredient_index
+from api.recipe_cache import get_recipes_data
 from api.permissions import IsAdminOrReadOnly
+from api.renderers import (SHOPPING_CART_RENDERERS,
+                           ShoppingCartContentNegotiation)
 from api.serializers import (
+    BatchSerializer,
     FavoriteSerializer,
     IngredientSerializer,
     SubscribeSerializer,
@@ -27,19 +40,45 @@ from api.serializers import (
     SubscriptionSerializer,
     UserSerializer,
 )
-from api.utils import create_shopping_cart
+from api.shopping_list_cache import (get_shopping_list_digest,
+                                     shopping_list_cache)
+from api.utils import (BATCH_INVALID, add_batch,
+                       get_ingredients_shopping_cart, get_recipes_preview,
+                       insert_ignore, remove_batch)
 
+from foodgram.db_router import primary_reads
 from recipes.models import (
     Favorite,
+    FeedEntry,
     Ingredient,
     Recipe,
-    RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag,
     User,
 )
 from users.models import Subscribe
-from .paginations import PageNumberPagination
+from .paginations import (FeedPagination, PageNumberPagination,
+                          RecipePagination, SubscriptionPagination)
+
+
+class BatchActionMixin:
+    """Пакетные действия: в теле запроса список `ids`, в ответе статус
+    по каждому id.
+    """
+
+    def get_batch_ids(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data["ids"]
+
+    def get_batch_response(self, ids, statuses):
+        return Response({
+            "results": [
+                {"id": object_id, "status": statuses[object_id]}
+                for object_id in ids
+            ]
+        })
 
 
 class CustomUserViewSet(UserViewSet):
@@ -49,13 +88,28 @@ class CustomUserViewSet(UserViewSet):
     ]
     pagination_class = PageNumberPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_authenticated:
+            queryset = queryset.annotate(
+                subscribed=Exists(
+                    Subscribe.objects.filter(
+                        user=self.request.user,
+                        author_id=OuterRef("pk"),
+                    )
+                )
+            )
+        return queryset
+
     def get_serializer_class(self):
+        if self.action == "set_password":
+            return super().get_serializer_class()
         if self.request.method == "POST":
             return UserСreateSerializer
         return UserSerializer
 
 
-class SubscribeViewSet(ModelViewSet):
+class SubscribeViewSet(BatchActionMixin, ModelViewSet):
     serializer_class = SubscriptionSerializer
     queryset = User.objects.all()
     permission_classes = [
@@ -73,37 +127,90 @@ class SubscribeViewSet(ModelViewSet):
     def subscribe(self, request, pk=None):
         if self.request.method == 'POST':
             author = get_object_or_404(User, pk=pk)
-            Subscribe.objects.create(user=request.user, author=author)
+            if author == request.user:
+                return Response(
+                    {"errors": "Нельзя подписаться на самого себя."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            with transaction.atomic():
+                created = insert_ignore(Subscribe, user=request.user,
+                                        author=author)
+                if created:
+                    FeedEntry.objects.follow(request.user, author)
+            if not created:
+                return Response(
+                    {"errors": "Вы уже подписаны на этого автора."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             return Response(status=status.HTTP_201_CREATED)
 
         if self.request.method == 'DELETE':
-            author = get_object_or_404(User, pk=pk)
-            del_count, _ = Subscribe.objects.filter(
-                user=request.user, author=author
-            ).delete()
+            with transaction.atomic():
+                del_count, _ = Subscribe.objects.filter(
+                    user=request.user, author_id=pk
+                ).delete()
+                if del_count:
+                    FeedEntry.objects.unfollow(request.user, pk)
 
             if del_count:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=False, methods=["post", "delete"],
+            permission_classes=[IsAuthenticated])
+    def subscribe_batch(self, request):
+        """Подписка на авторов и отписка от них списком id."""
+        user = request.user
+        ids = self.get_batch_ids(request)
+        with transaction.atomic():
+            if request.method == "POST":
+                created, statuses = add_batch(
+                    Subscribe, "author", user,
+                    [author_id for author_id in ids if author_id != user.id],
+                    User.objects.all(),
+                )
+                FeedEntry.objects.follow_authors(user, created)
+                if user.id in ids:
+                    statuses[user.id] = BATCH_INVALID
+            else:
+                deleted, statuses = remove_batch(
+                    Subscribe, "author", user, ids)
+                FeedEntry.objects.unfollow_authors(user, deleted)
+        return self.get_batch_response(ids, statuses)
+
     @action(methods=['get'], detail=False,
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        subscriptions = User.objects.filter(following__user=request.user).all()
-        paginator = PageNumberPagination()
+        subscriptions = User.objects.filter(
+            following__user=request.user
+        ).annotate(
+            recipes_count=Count("author", distinct=True),
+            subscribed=Value(True, output_field=BooleanField()),
+        ).order_by("id")
+        paginator = SubscriptionPagination()
         paginated_subscriptions = paginator.paginate_queryset(subscriptions,
                                                               request)
+        prefetch_related_objects(
+            paginated_subscriptions,
+            Prefetch(
+                "author",
+                queryset=get_recipes_preview(
+                    request.query_params.get("recipes_limit")),
+                to_attr="recipes_preview",
+            ),
+        )
         serializer = self.get_serializer(paginated_subscriptions, many=True)
         return paginator.get_paginated_response(serializer.data)
 
 
-class TagViewsSet(viewsets.ReadOnlyModelViewSet):
+class TagViewsSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [
         IsAdminOrReadOnly,
     ]
     pagination_class = None
+    cache_models = (Tag,)
 
 
 class RecipeViewSet(ModelViewSet):
@@ -112,131 +219,264 @@ class RecipeViewSet(ModelViewSet):
     permission_classes = [
         IsAuthenticatedOrReadOnly,
     ]
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
-    def get_queryset(self):
-        queryset = (
-            super().get_queryset()
-            .select_related("author")
-            .prefetch_related("tags")
+    # Поля, нужные пагинации; само представление берётся из кеша.
+    page_fields = ("id", "pub_date", "favorites_count", "in_carts_count")
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.only(*self.page_fields))
+        return self.get_paginated_response(
+            get_recipes_data([recipe.id for recipe in page], request))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            recipe_id = int(kwargs["pk"])
+        except ValueError:
+            raise Http404
+        data = get_recipes_data([recipe_id], request)
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    @action(detail=False, permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые сначала."""
+        large_authors = FeedEntry.objects.get_large_authors(request.user)
+        if large_authors:
+            paginator = self.paginator
+            recipe_ids = [
+                recipe.id for recipe in paginator.paginate_queryset(
+                    self.get_queryset().filter(
+                        Q(id__in=FeedEntry.objects.filter(
+                            user=request.user).values("recipe_id"))
+                        | Q(author_id__in=large_authors)
+                    ).only(*self.page_fields).order_by("-pub_date", "-id"),
+                    request,
+                    view=self,
+                )
+            ]
+        else:
+            paginator = FeedPagination()
+            recipe_ids = [
+                entry.recipe_id for entry in paginator.paginate_queryset(
+                    FeedEntry.objects.filter(user=request.user)
+                    .only("recipe_id", "pub_date")
+                    .order_by("-pub_date", "-recipe_id"),
+                    request,
+                    view=self,
+                )
+            ]
+        return paginator.get_paginated_response(
+            get_recipes_data(recipe_ids, request))
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        amounts = ShoppingListItem.objects.get_amounts([instance.id])
+        ShoppingListItem.objects.change(
+            list(instance.shoppingcart_set.values_list("user_id", flat=True)),
+            {ingredient_id: -amount
+             for ingredient_id, amount in amounts.items()},
         )
-
-        if self.request.user.is_authenticated:
-            queryset = queryset.annotate(
-                is_favorited=Exists(
-                    Favorite.objects.filter(
-                        user=self.request.user,
-                        recipe_id=OuterRef("pk"),
-                    )
-                ),
-                is_in_shopping_cart=Exists(
-                    ShoppingCart.objects.filter(
-                        user=self.request.user,
-                        recipe_id=OuterRef("pk"),
-                    )
-                ),
-            )
-        return queryset
+        instance.delete()
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [
         IsAuthenticatedOrReadOnly,
     ]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
-    search_fields = [
-        "^name",
-    ]
+    cache_models = (Ingredient,)
+
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get(api_settings.SEARCH_PARAM):
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.search, request)
+
+    def search(self, request):
+        name = request.query_params[api_settings.SEARCH_PARAM]
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        try:
+            limit = min(int(request.query_params["limit"]), limit)
+        except (KeyError, ValueError):
+            pass
+        return Response(ingredient_index.search(name, max(limit, 0)))
 
 
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(BatchActionMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
+    permission_classes = (IsAuthenticated,)
 
     @action(detail=True, methods=["post", "delete"])
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        favorite = Favorite.objects.filter(
-            user=request.user, recipe=recipe).first()
-        serializer = FavoriteSerializer(
-            favorite, data=request.data,
-            context={"request": request}
-        )
-        user = self.request.user
-
-        if request.method == "DELETE" and favorite:
-            favorite.delete()
+        if request.method == "DELETE":
+            with transaction.atomic():
+                deleted, _ = Favorite.objects.filter(
+                    user=request.user, recipe_id=pk).delete()
+                if deleted:
+                    Recipe.objects.filter(pk=pk).change_counter(
+                        "favorites_count", -1)
+            if not deleted:
+                return Response(
+                    {"errors": "Рецепта нет в избранном."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             return Response(
                 {"message": "Рецепт успешно удален из избранного"},
                 status=status.HTTP_204_NO_CONTENT,
             )
 
-        if self.request.method == "POST":
-            if Favorite.objects.filter(user=user, recipe=recipe).exists():
-                return Response({"message": "Рецепт уже в избранном"})
-            Favorite.objects.create(user=user, recipe=recipe)
-            serializer = ActionRecipeSerializer(
-                recipe, context={"request": request})
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-
-        serializer.is_valid(raise_exception=True)
-        Favorite.objects.create(user=request.user, recipe=recipe)
-
-        return Response(serializer.errors,
-                        status=status.HTTP_400_BAD_REQUEST)
-
-
-class ShoppingCartViewSet(viewsets.ModelViewSet):
-    @action(methods=["post", "delete"], detail=True)
-    def shopping_cart(self, request, pk):
         recipe = get_object_or_404(Recipe, id=pk)
-        user = self.request.user
-        shopping_cart = ShoppingCart.objects.filter(
-            user=request.user, recipe=recipe
-        ).first()
-
+        with transaction.atomic():
+            created = insert_ignore(Favorite, user=request.user,
+                                    recipe=recipe)
+            if created:
+                Recipe.objects.filter(pk=recipe.id).change_counter(
+                    "favorites_count", 1)
+        if not created:
+            return Response(
+                {"errors": "Рецепт уже в избранном."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         serializer = ActionRecipeSerializer(
             recipe, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post", "delete"])
+    def favorite_batch(self, request):
+        """Добавление рецептов в избранное и удаление из него списком id."""
+        ids = self.get_batch_ids(request)
+        with transaction.atomic():
+            if request.method == "POST":
+                changed, statuses = add_batch(
+                    Favorite, "recipe", request.user, ids,
+                    Recipe.objects.all())
+                delta = 1
+            else:
+                changed, statuses = remove_batch(
+                    Favorite, "recipe", request.user, ids)
+                delta = -1
+            Recipe.objects.filter(pk__in=changed).change_counter(
+                "favorites_count", delta)
+        return self.get_batch_response(ids, statuses)
+
+
+class ShoppingCartViewSet(BatchActionMixin, viewsets.ModelViewSet):
+    permission_classes = (IsAuthenticated,)
 
-        if self.request.method == "POST":
-            if ShoppingCart.objects.filter(user=user,
-                                           recipe=recipe).exists():
+    @action(methods=["post", "delete"], detail=True)
+    def shopping_cart(self, request, pk):
+        user = request.user
+        if request.method == "DELETE":
+            with transaction.atomic():
+                deleted, _ = ShoppingCart.objects.filter(
+                    user=user, recipe_id=pk).delete()
+                if deleted:
+                    ShoppingListItem.objects.remove_recipes(user, [pk])
+                    Recipe.objects.filter(pk=pk).change_counter(
+                        "in_carts_count", -1)
+            if not deleted:
                 return Response(
-                    {"message": "Рецепт уже находится в списке покупок."},
+                    {"errors": "Рецепта нет в списке покупок."},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
-            ShoppingCart.objects.create(user=user, recipe=recipe)
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-
-        if request.method == "DELETE" and shopping_cart:
-            shopping_cart.delete()
             return Response(
                 {"message": "Рецепт успешно удалён."},
                 status=status.HTTP_204_NO_CONTENT
             )
 
-        return Response(serializer.data,
-                        status=status.HTTP_201_CREATED)
+        recipe = get_object_or_404(Recipe, id=pk)
+        with transaction.atomic():
+            created = insert_ignore(ShoppingCart, user=user, recipe=recipe)
+            if created:
+                ShoppingListItem.objects.add_recipes(user, [recipe.id])
+                Recipe.objects.filter(pk=recipe.id).change_counter(
+                    "in_carts_count", 1)
+        if not created:
+            return Response(
+                {"errors": "Рецепт уже находится в списке покупок."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = ActionRecipeSerializer(
+            recipe, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["post", "delete"])
+    def shopping_cart_batch(self, request):
+        """Добавление рецептов в список покупок и удаление из него
+        списком id.
+        """
+        user = request.user
+        ids = self.get_batch_ids(request)
+        with transaction.atomic():
+            if request.method == "POST":
+                changed, statuses = add_batch(
+                    ShoppingCart, "recipe", user, ids, Recipe.objects.all())
+                ShoppingListItem.objects.add_recipes(user, changed)
+                delta = 1
+            else:
+                changed, statuses = remove_batch(
+                    ShoppingCart, "recipe", user, ids)
+                ShoppingListItem.objects.remove_recipes(user, changed)
+                delta = -1
+            Recipe.objects.filter(pk__in=changed).change_counter(
+                "in_carts_count", delta)
+        return self.get_batch_response(ids, statuses)
 
     @action(detail=False, methods=("get",),
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_CART_RENDERERS,
+            content_negotiation_class=ShoppingCartContentNegotiation)
     def download_shopping_cart(self, request):
-        shopping_cart = list(
-            ShoppingCart.objects.filter(user=self.request.user))
-        recipes = [item.recipe.id for item in shopping_cart]
-        buy_list = (
-            RecipeIngredient.objects.filter(recipe__in=recipes)
-            .values("ingredient")
-            .annotate(amount=Sum("amount"))
-        )
-        buy_list_text = create_shopping_cart(buy_list)
-        response = FileResponse(buy_list_text, content_type="text/plain")
-        response[
-            "Content-Disposition"
-        ] = "attachment; filename=shopping-list.txt"
+        """Файл списка покупок; готовые файлы берутся из кеша по хешу
+        содержимого корзины, он же служит `ETag`.
+        """
+        renderer = request.accepted_renderer
+        digest = get_shopping_list_digest(request.user, renderer)
+        etag = f'"{digest}"'
+        if_none_match = request.headers.get("If-None-Match", "")
+        if etag in (tag.strip() for tag in if_none_match.split(",")):
+            response = HttpResponseNotModified()
+        else:
+            file = shopping_list_cache.open(digest, renderer)
+            if file is None:
+                # Файл ложится в кеш под текущими версиями рецептов,
+                # поэтому читается из основной базы.
+                with primary_reads():
+                    file = shopping_list_cache.store(
+                        digest,
+                        renderer,
+                        renderer.stream(get_ingredients_shopping_cart(
+                            request.user).iterator()),
+                    )
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f"{content_type}; charset={renderer.charset}"
+            response = FileResponse(file, content_type=content_type)
+            response[
+                "Content-Disposition"
+            ] = f"attachment; filename=shopping-list.{renderer.format}"
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
         return response
+
+    def handle_exception(self, exc):
+        # Ошибки отдаются в JSON, а не в формате выгрузки.
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return super().handle_exception(exc)
+
+
+class TokenCacheStatsView(APIView):
+    """Статистика кеша токенов в процессе, обслужившем запрос."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(token_cache.get_stats())
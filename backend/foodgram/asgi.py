@@ -2,6 +2,8 @@
 ASGI config for foodgram project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are routed through ``ASGI_URLCONF``, where the hot read endpoints
+are served by async views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +11,53 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "foodgram.settings")
 
-application = get_asgi_application()
+
+class AsyncRoutesASGIHandler(ASGIHandler):
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = settings.ASGI_URLCONF
+        return request, error_response
+
+    async def send_response(self, response, send):
+        """Как в `ASGIHandler`, но потоковый ответ читается в пуле
+        потоков, а не в цикле событий, и не собирается в память целиком.
+        """
+        if not response.streaming:
+            return await super().send_response(response, send)
+        # Модули приложений импортируются только после django.setup().
+        from api.async_views import iterate_blocking
+
+        headers = [
+            (header.encode("ascii"), value.encode("latin1"))
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": headers,
+        })
+        async for part in iterate_blocking(response):
+            for chunk, _ in self.chunk_bytes(part):
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                })
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+django.setup(set_prefix=False)
+application = AsyncRoutesASGIHandler()
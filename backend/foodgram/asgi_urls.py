@@ -0,0 +1,7 @@
+from django.conf import settings
+
+from api.async_views import get_async_urlpatterns
+from foodgram.urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = get_async_urlpatterns(
+    wsgi_urlpatterns, settings.ASYNC_VIEW_ROUTES)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from hashlib import sha256
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Токены читаются из основной базы: только что выданный токен
+# может ещё не дойти до реплики.
+PRIMARY_MODELS = {"authtoken.token"}
+
+# Отставание считается только пока реплика не догнала полученный WAL,
+# иначе на простаивающей базе оно росло бы без записей.
+REPLICATION_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery()
+            OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+read_database = ContextVar("read_database", default=None)
+
+
+@contextmanager
+def primary_reads():
+    """Чтения внутри блока идут в основную базу.
+
+    Нужен там, где прочитанное кешируется под текущей версией данных:
+    отставшая реплика положила бы в кеш устаревшие данные.
+    """
+    token = read_database.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+class ReplicaPool:
+    """Выбор исправной реплики с периодической проверкой.
+
+    Реплика, к которой не удалось подключиться или которая отстала больше
+    чем на `REPLICA_MAX_LAG` секунд, исключается на `REPLICA_RETRY_AFTER`
+    секунд. Состояние хранится в памяти процесса.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = {}
+        self._down_until = {}
+
+    def get_replica(self):
+        healthy = [
+            alias for alias in settings.DATABASE_REPLICAS
+            if self.is_healthy(alias)
+        ]
+        return random.choice(healthy) if healthy else None
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            if self._down_until.get(alias, 0) > now:
+                return False
+            checked_at = self._checked_at.get(alias)
+            if (
+                checked_at is not None
+                and now - checked_at < settings.REPLICA_HEALTH_CHECK_INTERVAL
+            ):
+                return True
+            # Проверку выполняет один поток, остальные пока считают
+            # реплику исправной.
+            self._checked_at[alias] = now
+        if self.check(alias):
+            return True
+        with self._lock:
+            self._down_until[alias] = now + settings.REPLICA_RETRY_AFTER
+        return False
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor != "postgresql":
+                    cursor.execute("SELECT 1")
+                    return True
+                cursor.execute(REPLICATION_LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError as error:
+            logger.warning("Реплика %s недоступна: %s", alias, error)
+            connection.close()
+            return False
+        if lag > settings.REPLICA_MAX_LAG:
+            logger.warning("Реплика %s отстаёт на %.1f с", alias, lag)
+            return False
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._checked_at.clear()
+            self._down_until.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+class ReplicaRouter:
+    """Запись в основную базу, чтение — в базу, выбранную
+    `ReplicaMiddleware` для текущего запроса.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = read_database.get()
+        if (
+            alias is None
+            or model._meta.label_lower in PRIMARY_MODELS
+            # Внутри транзакции читаем то, что только что записали.
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными от основной базы.
+        return db not in settings.DATABASE_REPLICAS
+
+
+def get_sticky_key(request):
+    """Ключ клиента в кеше: по заголовку авторизации или сессии."""
+    credentials = request.META.get("HTTP_AUTHORIZATION") or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    return f"db:primary:{sha256(credentials.encode()).hexdigest()}"
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтений запроса.
+
+    Реплики обслуживают безопасные запросы по путям из
+    `REPLICA_READ_PATHS`. После изменяющего запроса клиент
+    `REPLICA_STICKY_SECONDS` секунд читает из основной базы, чтобы видеть
+    свои изменения; для этого кеш должен быть общим для всех процессов.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Признак, по которому Django вызывает middleware асинхронно.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.acall(request)
+        token = read_database.set(self.get_read_database(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(token)
+        self.remember_write(request, response)
+        return response
+
+    async def acall(self, request):
+        token = read_database.set(
+            await sync_to_async(self.get_read_database)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_database.reset(token)
+        await sync_to_async(self.remember_write)(request, response)
+        return response
+
+    def get_read_database(self, request):
+        if (
+            not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS
+            or not request.path.startswith(settings.REPLICA_READ_PATHS)
+        ):
+            return DEFAULT_DB_ALIAS
+        key = get_sticky_key(request)
+        if key is not None and cache.get(key):
+            return DEFAULT_DB_ALIAS
+        return replica_pool.get_replica() or DEFAULT_DB_ALIAS
+
+    def remember_write(self, request, response):
+        if (
+            not settings.DATABASE_REPLICAS
+            or request.method in SAFE_METHODS
+            or response.status_code >= 400
+        ):
+            return
+        key = get_sticky_key(request)
+        if key is not None:
+            cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def get_estimated_count(queryset):
+    """Число строк таблицы по статистике PostgreSQL или None, если
+    оценки нет.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class "
+            "WHERE oid = to_regclass(%s)",
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # До первого ANALYZE reltuples равен -1 (или 0 в старых версиях).
+    if row is None or row[0] <= 0:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки, который для больших таблиц без фильтров
+    берёт число строк из статистики вместо COUNT(*).
+
+    Оценка используется, начиная с `ADMIN_ESTIMATED_COUNT_THRESHOLD`
+    строк; отфильтрованные списки считаются точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.where:
+            return super().count
+        estimate = get_estimated_count(queryset)
+        if (
+            estimate is None
+            or estimate < settings.ADMIN_ESTIMATED_COUNT_THRESHOLD
+        ):
+            return super().count
+        return estimate
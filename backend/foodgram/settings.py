@@ -29,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.RequestMetricsMiddleware",
+    "foodgram.db_router.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,12 +62,49 @@ WSGI_APPLICATION = "foodgram.wsgi.application"
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('DB_NAME', 'foodgram'),
         'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'foodgram_password'),
-        'HOST': 'db',
-        'PORT': os.getenv('DB_PORT', 5432)
+        'HOST': os.getenv('DB_HOST', 'db'),
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+    }
+}
+
+# Реплики для чтения: хосты через запятую, остальные параметры
+# подключения берутся у основной базы.
+DATABASE_REPLICAS = []
+for index, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    DATABASE_REPLICAS.append(f'replica_{index}')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ["foodgram.db_router.ReplicaRouter"]
+
+# Чтение безопасными методами по этим путям идёт в реплики.
+REPLICA_READ_PATHS = ("/api/",)
+# Сколько секунд после записи чтения клиента идут в основную базу.
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 15))
+REPLICA_HEALTH_CHECK_INTERVAL = int(
+    os.getenv("REPLICA_HEALTH_CHECK_INTERVAL", 10))
+# На сколько секунд исключается реплика, не прошедшая проверку.
+REPLICA_RETRY_AFTER = int(os.getenv("REPLICA_RETRY_AFTER", 30))
+# Допустимое отставание реплики в секундах.
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 5))
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
     }
 }
 
@@ -108,7 +147,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': [
         'rest_framework.pagination.PageNumberPagination',
@@ -131,3 +170,127 @@ DJOSER = {
 }
 
 AUTH_USER_MODEL = "users.User"
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    "SHOPPING_CART_PDF_FONT",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+# Готовые файлы списков покупок: каталог, наибольший возраст в секундах
+# и общий размер в байтах. Проверка выполняется не чаще раза
+# в SHOPPING_LIST_CACHE_PRUNE_INTERVAL секунд и командой
+# prune_shopping_lists.
+SHOPPING_LIST_CACHE_DIR = os.getenv(
+    "SHOPPING_LIST_CACHE_DIR", os.path.join(BASE_DIR, "shopping_lists"))
+SHOPPING_LIST_CACHE_MAX_AGE = int(
+    os.getenv("SHOPPING_LIST_CACHE_MAX_AGE", 24 * 60 * 60))
+SHOPPING_LIST_CACHE_MAX_SIZE = int(
+    os.getenv("SHOPPING_LIST_CACHE_MAX_SIZE", 100 * 1024 * 1024))
+SHOPPING_LIST_CACHE_PRUNE_INTERVAL = int(
+    os.getenv("SHOPPING_LIST_CACHE_PRUNE_INTERVAL", 5 * 60))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv("INGREDIENT_SEARCH_LIMIT", 50))
+INGREDIENT_INDEX_TTL = int(os.getenv("INGREDIENT_INDEX_TTL", 300))
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 60 * 60))
+RECIPE_CACHE_TIMEOUT = int(os.getenv("RECIPE_CACHE_TIMEOUT", 60 * 60))
+# Версии отдельных рецептов живут дольше закешированных по ним данных
+# и файлов списков покупок; истёкшая версия создаётся заново и не
+# совпадает с прежней.
+OBJECT_VERSION_TIMEOUT = int(os.getenv(
+    "OBJECT_VERSION_TIMEOUT",
+    2 * max(RECIPE_CACHE_TIMEOUT, SHOPPING_LIST_CACHE_MAX_AGE),
+))
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 5 * 60))
+# Срок, за который в остальных процессах устаревает отозванный токен.
+TOKEN_CACHE_LOCAL_TTL = int(os.getenv("TOKEN_CACHE_LOCAL_TTL", 10))
+
+# Рецепты авторов с большим числом подписчиков не раскладываются по лентам
+# при публикации, а подмешиваются при чтении ленты.
+FEED_FANOUT_LIMIT = int(os.getenv("FEED_FANOUT_LIMIT", 1000))
+
+# С какого размера таблицы админка показывает оценочное число строк.
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv("ADMIN_ESTIMATED_COUNT_THRESHOLD", 100000))
+
+# Наибольшее число id в одном пакетном запросе.
+BATCH_SIZE_LIMIT = int(os.getenv("BATCH_SIZE_LIMIT", 100))
+
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "True") == "True"
+
+# Бюджеты запросов по имени маршрута и методу: число SQL-запросов, время
+# в базе и общее время в миллисекундах. HEAD проверяется по бюджету GET.
+# Превышения пишутся в журнал. Бюджет нужен каждому маршруту `api.urls`
+# и каждому его методу, это проверяется тестами.
+REQUEST_BUDGET_DEFAULT = {"queries": 10, "db_ms": 200, "total_ms": 500}
+REQUEST_BUDGETS = {
+    ("api-root", "GET"): {"queries": 2},
+    ("recipes-list", "GET"): {"queries": 8},
+    ("recipes-list", "POST"): {"queries": 20},
+    ("recipes-detail", "GET"): {"queries": 7},
+    ("recipes-detail", "PUT"): {"queries": 28},
+    ("recipes-detail", "PATCH"): {"queries": 28},
+    ("recipes-detail", "DELETE"): {"queries": 15},
+    ("recipes-feed", "GET"): {"queries": 9},
+    ("subscriptions", "GET"): {"queries": 5},
+    ("subscribe", "POST"): {"queries": 8},
+    ("subscribe", "DELETE"): {"queries": 6},
+    ("favorite", "POST"): {"queries": 6},
+    ("favorite", "DELETE"): {"queries": 6},
+    ("shopping-cart", "POST"): {"queries": 10},
+    ("shopping-cart", "DELETE"): {"queries": 8},
+    ("favorite-batch", "POST"): {"queries": 6},
+    ("favorite-batch", "DELETE"): {"queries": 6},
+    ("shopping-cart-batch", "POST"): {"queries": 10},
+    ("shopping-cart-batch", "DELETE"): {"queries": 10},
+    ("subscribe-batch", "POST"): {"queries": 8},
+    ("subscribe-batch", "DELETE"): {"queries": 6},
+    ("download-shopping-cart", "GET"): {"queries": 3},
+    ("tags-list", "GET"): {"queries": 3},
+    ("tags-detail", "GET"): {"queries": 3},
+    ("ingredients-list", "GET"): {"queries": 3},
+    ("ingredients-detail", "GET"): {"queries": 3},
+    ("users-list", "GET"): {"queries": 3},
+    ("users-list", "POST"): {"queries": 6},
+    ("users-detail", "GET"): {"queries": 3},
+    ("users-detail", "PUT"): {"queries": 9},
+    ("users-detail", "PATCH"): {"queries": 9},
+    ("users-detail", "DELETE"): {"queries": 4},
+    ("users-me", "GET"): {"queries": 3},
+    ("users-me", "PUT"): {"queries": 9},
+    ("users-me", "PATCH"): {"queries": 9},
+    ("users-me", "DELETE"): {"queries": 4},
+    ("users-set-password", "POST"): {"queries": 6},
+    ("users-set-username", "POST"): {"queries": 3},
+    ("users-activation", "POST"): {"queries": 3},
+    ("users-resend-activation", "POST"): {"queries": 3},
+    ("users-reset-password", "POST"): {"queries": 3},
+    ("users-reset-password-confirm", "POST"): {"queries": 3},
+    ("users-reset-username", "POST"): {"queries": 3},
+    ("users-reset-username-confirm", "POST"): {"queries": 3},
+    ("login", "POST"): {"queries": 8},
+    ("logout", "POST"): {"queries": 6},
+    ("token-cache", "GET"): {"queries": 3},
+}
+
+# Маршруты, которые под ASGI обслуживают асинхронные представления;
+# блокирующая работа выполняется в пуле из ASYNC_VIEW_WORKERS потоков.
+ASGI_URLCONF = "foodgram.asgi_urls"
+ASYNC_VIEW_ROUTES = (
+    "recipes-list",
+    "recipes-detail",
+    "tags-list",
+    "tags-detail",
+    "ingredients-list",
+    "ingredients-detail",
+    "download-shopping-cart",
+)
+ASYNC_VIEW_WORKERS = int(os.getenv("ASYNC_VIEW_WORKERS", 8))
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv("IMAGE_PROCESSING_WORKERS", 2))
+RECIPE_IMAGE_SIZES = {
+    "card": (480, 480),
+    "detail": (1280, 1280),
+}
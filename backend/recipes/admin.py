@@ -1,23 +1,40 @@
 from django.contrib import admin
 
+from foodgram.paginators import EstimatedCountPaginator
 from .models import (Favorite, Ingredient, Recipe,
-                     RecipeIngredient, ShoppingCart, Tag)
+                     RecipeIngredient, ShoppingCart, Tag, count_recipe_rows)
 
 
 class RecipeIngredientInLine(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
     min_num = 1
+    autocomplete_fields = ("ingredient",)
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "author", "text", "cooking_time")
-    search_fields = ("name", "author")
-    list_filter = ("name", "author", "tags")
+    list_display = ("id", "name", "author", "text", "cooking_time",
+                    "ingredients_count", "favorites_count", "in_carts_count")
+    list_select_related = ("author",)
+    readonly_fields = ("favorites_count", "in_carts_count")
+    search_fields = ("name", "author__username", "author__email")
+    list_filter = ("tags",)
+    autocomplete_fields = ("author",)
     inlines = (RecipeIngredientInLine,)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            ingredients_count=count_recipe_rows(RecipeIngredient))
+
+    @admin.display(description="Ингредиентов",
+                   ordering="ingredients_count")
+    def ingredients_count(self, recipe):
+        return recipe.ingredients_count
+
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -31,29 +48,40 @@ class TagAdmin(admin.ModelAdmin):
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "measurement_unit")
     search_fields = ("name", "measurement_unit")
-    list_filter = ("name", "measurement_unit")
+    list_filter = ("measurement_unit",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientsAdmin(admin.ModelAdmin):
     list_display = ("id", "recipe", "ingredient", "amount")
-    search_fields = ("recipe", "ingredient")
-    list_filter = ("recipe", "ingredient")
+    list_select_related = ("recipe", "ingredient")
+    search_fields = ("recipe__name", "ingredient__name")
+    autocomplete_fields = ("recipe", "ingredient")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "recipe")
-    search_fields = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    list_select_related = ("user", "recipe")
+    search_fields = ("user__username", "user__email", "recipe__name")
+    autocomplete_fields = ("user", "recipe")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "recipe")
-    search_fields = ("user", "recipe")
-    list_filter = ("user", "recipe")
+    list_select_related = ("user", "recipe")
+    search_fields = ("user__username", "user__email", "recipe__name")
+    autocomplete_fields = ("user", "recipe")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
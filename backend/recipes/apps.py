@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def create_search_index(using, **kwargs):
+    from recipes.search import create_sqlite_index
+
+    if connections[using].vendor == "sqlite":
+        create_sqlite_index(using)
 
 
 class RecipesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "recipes"
+
+    def ready(self):
+        post_migrate.connect(create_search_index, sender=self)
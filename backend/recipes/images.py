@@ -0,0 +1,114 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from api.cache import bump_object_versions
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_FORMATS = {"JPEG", "PNG", "WEBP", "GIF"}
+
+executor = (
+    ThreadPoolExecutor(
+        max_workers=settings.IMAGE_PROCESSING_WORKERS,
+        thread_name_prefix="recipe-images",
+    )
+    if settings.IMAGE_PROCESSING_WORKERS else None
+)
+
+
+def open_image(field):
+    with field.open("rb") as file:
+        image = Image.open(file)
+        if image.format not in ALLOWED_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат: {image.format}")
+        image.load()
+    return image
+
+
+def encode(image, image_format, **params):
+    buffer = BytesIO()
+    image.save(buffer, image_format, **params)
+    return ContentFile(buffer.getvalue())
+
+
+def replace_file(field, name, content):
+    """Записывает файл под именем `name` поверх прежнего, чтобы выданные
+    ранее адреса оставались рабочими; возвращает сохранённое имя.
+
+    Хранилище не перезаписывает файлы, а подбирает свободное имя,
+    поэтому файл с тем же именем удаляется до сохранения.
+    """
+    old_name = field.name
+    field.storage.delete(name)
+    name = field.storage.save(name, content)
+    if old_name and old_name != name:
+        field.storage.delete(old_name)
+    return name
+
+
+def process_recipe_image(recipe_id):
+    """Обработка изображения рецепта вне запроса.
+
+    Оригинал пересохраняется без метаданных EXIF (с учётом ориентации),
+    для карточки и страницы рецепта готовятся уменьшенные копии в WebP.
+    """
+    recipe = Recipe.objects.only(
+        "id", "image", "image_card", "image_detail").get(pk=recipe_id)
+    if not recipe.image:
+        return
+    original = open_image(recipe.image)
+    image_format = original.format
+    image = ImageOps.exif_transpose(original)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    params = {"quality": 95} if image_format == "JPEG" else {}
+    name = recipe.image.name
+    updates = {
+        "image": replace_file(
+            recipe.image, name, encode(image, image_format, **params)),
+    }
+    for variant, size in settings.RECIPE_IMAGE_SIZES.items():
+        field = getattr(recipe, f"image_{variant}")
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        updates[f"image_{variant}"] = replace_file(
+            field,
+            field.field.generate_filename(recipe, f"{recipe.id}.webp"),
+            encode(resized, "WEBP", quality=80, method=4),
+        )
+    if Recipe.objects.filter(pk=recipe_id, image=name).update(**updates):
+        bump_object_versions(Recipe, [recipe_id])
+
+
+def run(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception("Не удалось обработать изображение рецепта %s",
+                         recipe_id)
+
+
+def run_in_worker(recipe_id):
+    try:
+        run(recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку изображения в очередь после фиксации транзакции.
+
+    При `IMAGE_PROCESSING_WORKERS = 0` обработка выполняется сразу.
+    """
+    if executor is None:
+        transaction.on_commit(lambda: run(recipe.id))
+    else:
+        transaction.on_commit(
+            lambda: executor.submit(run_in_worker, recipe.id))
@@ -0,0 +1,217 @@
+import random
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.cache import bump_version
+from recipes.models import (Favorite, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag, User)
+from users.models import Subscribe
+
+SYLLABLES = (
+    "ка", "ло", "ми", "ра", "ту", "не", "со", "ви", "ба", "гу",
+    "де", "жа", "зо", "ли", "пе", "ро", "сы", "фа", "ха", "чу",
+)
+MEASUREMENT_UNITS = ("г", "кг", "мл", "л", "шт.", "ст. л.", "ч. л.")
+TAG_COLORS = ("#E26C2D", "#49B64E", "#8775D2", "#F2C94C", "#2F80ED")
+IMAGE_NAME = "recipes/synthetic.png"
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерация синтетических пользователей, рецептов, избранного, "
+        "корзин и подписок. При одинаковом --seed на пустой базе данные "
+        "получаются одинаковыми."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--recipes", type=int, default=10,
+            help="Рецептов на пользователя.",
+        )
+        parser.add_argument(
+            "--ingredients", type=int, default=5,
+            help="Ингредиентов в рецепте.",
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=20,
+            help="Рецептов в избранном у пользователя.",
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5,
+            help="Рецептов в корзине у пользователя.",
+        )
+        parser.add_argument(
+            "--subscriptions", type=int, default=10,
+            help="Подписок у пользователя.",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", default="synthetic")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        prefix = self.prefix = options["prefix"]
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f"Пользователи с префиксом «{prefix}» уже есть, "
+                "укажите другой --prefix."
+            )
+        with transaction.atomic():
+            tags = self.get_tags()
+            ingredients = self.get_ingredients()
+            users = self.create_users(prefix, options["users"])
+            recipes = self.create_recipes(
+                users, options["recipes"], options["ingredients"],
+                ingredients, tags,
+            )
+            self.create_relations(users, recipes, options)
+            user_ids = User.objects.filter(
+                username__startswith=prefix).values("id")
+            # Агрегаты собираются так же, как после обычных запросов.
+            ShoppingListItem.objects.rebuild(user_ids)
+            FeedEntry.objects.rebuild(user_ids)
+            Recipe.objects.reconcile_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано пользователей: {len(users)}, рецептов: {len(recipes)}."
+        ))
+
+    def word(self, syllables=3):
+        return "".join(self.rnd.choices(SYLLABLES, k=syllables))
+
+    def words(self, count):
+        return " ".join(
+            self.word(self.rnd.randint(2, 4)) for _ in range(count))
+
+    def get_tags(self):
+        tags = list(Tag.objects.values_list("id", flat=True))
+        if tags:
+            return tags
+        Tag.objects.bulk_create(
+            Tag(name=f"Тег {index}", color=color, slug=f"tag{index}")
+            for index, color in enumerate(TAG_COLORS)
+        )
+        bump_version(Tag)
+        return list(Tag.objects.values_list("id", flat=True))
+
+    def get_ingredients(self):
+        ingredients = list(Ingredient.objects.values_list("id", flat=True))
+        if ingredients:
+            return ingredients
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=f"{self.words(2)} {index}",
+                           measurement_unit=self.rnd.choice(
+                               MEASUREMENT_UNITS))
+                for index in range(1000)
+            ),
+            batch_size=self.batch_size,
+        )
+        bump_version(Ingredient)
+        return list(Ingredient.objects.values_list("id", flat=True))
+
+    def create_users(self, prefix, count):
+        password = make_password(None)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f"{prefix}{index}",
+                    email=f"{prefix}{index}@example.com",
+                    first_name=self.word(),
+                    last_name=self.word(),
+                    password=password,
+                )
+                for index in range(count)
+            ),
+            batch_size=self.batch_size,
+        )
+        return list(
+            User.objects.filter(username__startswith=prefix).order_by("id"))
+
+    def create_recipes(self, users, per_user, per_recipe, ingredients, tags):
+        if not default_storage.exists(IMAGE_NAME):
+            buffer = BytesIO()
+            Image.new("RGB", (64, 64), "#E26C2D").save(buffer, "PNG")
+            default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=user,
+                    name=self.words(self.rnd.randint(1, 4)).capitalize(),
+                    text=self.words(self.rnd.randint(20, 80)),
+                    cooking_time=self.rnd.randint(1, 180),
+                    image=IMAGE_NAME,
+                )
+                for user in users
+                for _ in range(per_user)
+            ),
+            batch_size=self.batch_size,
+        )
+        recipes = list(
+            Recipe.objects.filter(author__username__startswith=self.prefix)
+            .order_by("id").values_list("id", flat=True)
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(recipe_id=recipe_id,
+                                 ingredient_id=ingredient_id,
+                                 amount=self.rnd.randint(1, 500))
+                for recipe_id in recipes
+                for ingredient_id in self.rnd.sample(
+                    ingredients, min(per_recipe, len(ingredients)))
+            ),
+            batch_size=self.batch_size,
+        )
+        recipe_tag = Recipe.tags.through
+        recipe_tag.objects.bulk_create(
+            (
+                recipe_tag(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipes
+                for tag_id in self.rnd.sample(
+                    tags, self.rnd.randint(1, min(3, len(tags))))
+            ),
+            batch_size=self.batch_size,
+        )
+        return recipes
+
+    def create_relations(self, users, recipes, options):
+        """Избранное, корзины и подписки; популярность рецептов
+        и авторов распределена неравномерно, как в реальных данных.
+        """
+        recipe_weights = [1 / (rank + 1) for rank in range(len(recipes))]
+        user_weights = [1 / (rank + 1) for rank in range(len(users))]
+        for model, field, count, population, weights in (
+            (Favorite, "recipe_id", options["favorites"], recipes,
+             recipe_weights),
+            (ShoppingCart, "recipe_id", options["carts"], recipes,
+             recipe_weights),
+            (Subscribe, "author_id", options["subscriptions"],
+             [user.id for user in users], user_weights),
+        ):
+            model.objects.bulk_create(
+                (
+                    model(user=user, **{field: value})
+                    for user in users
+                    for value in self.sample(population, weights, count)
+                    if value != user.id or model is not Subscribe
+                ),
+                batch_size=self.batch_size,
+            )
+
+    def sample(self, population, weights, count):
+        """Выборка без повторов с весами."""
+        if count >= len(population):
+            return list(population)
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(
+                self.rnd.choices(population, weights, k=count - len(chosen)))
+        return sorted(chosen)
@@ -1,29 +1,147 @@
-import csv
-import os
-
-from django.conf import settings
-from django.core.management import BaseCommand
-
-from recipes.models import Ingredient
-
-
-class Command(BaseCommand):
-    help = "Загрузка ингредиентов в базу данных."
-
-    def handle(self, *args, **kwargs):
-        base_dir = settings.BASE_DIR
-        data_path = os.path.join(base_dir, "data", "ingredients.csv")
-
-        with open(data_path, mode="r", encoding="utf-8") as file:
-            csv_reader = csv.reader(file, delimiter=",")
-            for row in csv_reader:
-                _, created = Ingredient.objects.get_or_create(
-                    name=row[0], defaults={"measurement_unit": row[1]}
-                )
-                if created:
-                    self.stdout.write(f"Создан ингредиент: {row[0]}")
-                else:
-                    self.stdout.write(f"Ингредиент {row[0]} уже существует")
-            self.stdout.write(self.style.SUCCESS(
-                "Ингредиенты успешно загружены."
-            ))
+import csv
+import os
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from api.cache import bump_version
+from recipes.models import Ingredient
+
+MAX_LENGTH = Ingredient._meta.get_field("name").max_length
+BATCH_SIZE = 1000
+
+
+class RowStream:
+    """Файлоподобный объект для COPY: отдаёт строки CSV по требованию."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ""
+        self.writer = csv.writer(self, lineterminator="\n")
+
+    def write(self, value):
+        return value
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += self.writer.writerow(row)
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+class Command(BaseCommand):
+    help = "Загрузка ингредиентов в базу данных."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=[os.path.join(settings.BASE_DIR, "data",
+                                  "ingredients.csv")],
+            help="CSV-файлы со строками `название,единица измерения`.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help=f"Размер пачки для bulk_create, по умолчанию {BATCH_SIZE}. "
+                 "В PostgreSQL строки загружаются одним COPY, и параметр "
+                 "не используется.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Посчитать изменения, не сохраняя их.",
+        )
+
+    def handle(self, *args, **options):
+        stats = Counter()
+        batch_size = options["batch_size"] or BATCH_SIZE
+        if connection.vendor == "postgresql" and options["batch_size"]:
+            self.stderr.write(self.style.WARNING(
+                "--batch-size не используется: в PostgreSQL строки "
+                "загружаются одним COPY."
+            ))
+        with transaction.atomic():
+            for path in options["paths"]:
+                with open(path, mode="r", encoding="utf-8") as file:
+                    rows = self.read_rows(csv.reader(file), stats)
+                    if connection.vendor == "postgresql":
+                        self.copy_rows(rows, stats)
+                    else:
+                        self.create_rows(rows, batch_size, stats)
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+        if stats["created"] and not options["dry_run"]:
+            bump_version(Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            ("Проверка завершена" if options["dry_run"]
+             else "Ингредиенты успешно загружены")
+            + f": создано {stats['created']}, "
+            f"уже существовало {stats['skipped']}, "
+            f"с ошибками {stats['invalid']}."
+        ))
+
+    def read_rows(self, reader, stats):
+        for row in reader:
+            if len(row) != 2:
+                stats["invalid"] += 1
+                continue
+            name, measurement_unit = (value.strip() for value in row)
+            if (
+                not name or not measurement_unit
+                or len(name) > MAX_LENGTH or len(measurement_unit) > MAX_LENGTH
+            ):
+                stats["invalid"] += 1
+                continue
+            yield name, measurement_unit
+
+    def create_rows(self, rows, batch_size, stats):
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            existing = set(
+                Ingredient.objects.filter(
+                    name__in={name for name, _ in batch}
+                ).values_list("name", "measurement_unit")
+            )
+            new = [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in dict.fromkeys(batch)
+                if (name, measurement_unit) not in existing
+            ]
+            Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+            stats["created"] += len(new)
+            stats["skipped"] += len(batch) - len(new)
+
+    def copy_rows(self, rows, stats):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE ingredient_staging "
+                f"(name varchar({MAX_LENGTH}), "
+                f"measurement_unit varchar({MAX_LENGTH}))"
+            )
+            cursor.copy_expert(
+                "COPY ingredient_staging FROM STDIN WITH (FORMAT csv)",
+                RowStream(rows),
+            )
+            cursor.execute("SELECT COUNT(*) FROM ingredient_staging")
+            total = cursor.fetchone()[0]
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT DISTINCT name, measurement_unit "
+                "FROM ingredient_staging "
+                "ON CONFLICT (name, measurement_unit) DO NOTHING"
+            )
+            stats["created"] += cursor.rowcount
+            stats["skipped"] += total - cursor.rowcount
+            cursor.execute("DROP TABLE ingredient_staging")
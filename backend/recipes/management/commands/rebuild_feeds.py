@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import FeedEntry
+
+
+class Command(BaseCommand):
+    help = "Пересборка лент рецептов из подписок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Ограничиться пользователем с указанным id.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            FeedEntry.objects.rebuild(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS("Ленты пересобраны."))
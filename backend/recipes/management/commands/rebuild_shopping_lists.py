@@ -0,0 +1,60 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = "Пересборка или проверка агрегированных списков покупок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только сравнить списки покупок с корзинами.",
+        )
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Ограничиться пользователем с указанным id.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not options["check"]:
+            with transaction.atomic():
+                ShoppingListItem.objects.rebuild(user_ids)
+            self.stdout.write(self.style.SUCCESS(
+                "Списки покупок пересобраны."
+            ))
+            return
+
+        expected = ShoppingListItem.objects.calculate(user_ids)
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in items.values_list(
+                "user_id", "ingredient_id", "amount")
+        }
+        mismatches = sorted(
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        )
+        for user_id, ingredient_id in mismatches:
+            self.stdout.write(
+                f"Пользователь {user_id}, ингредиент {ingredient_id}: "
+                f"ожидается {expected.get((user_id, ingredient_id), 0)}, "
+                f"сохранено {actual.get((user_id, ingredient_id), 0)}"
+            )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(
+                f"Расхождений: {len(mismatches)}."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                "Списки покупок совпадают с корзинами."
+            ))
@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверка счётчиков избранного и списков покупок рецептов "
+        "с фактическим числом записей."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только показать расхождения, не исправляя их.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            fixed = Recipe.objects.reconcile_counters()
+            self.stdout.write(self.style.SUCCESS(
+                f"Исправлено рецептов: {fixed}."
+            ))
+            return
+
+        drifted = Recipe.objects.with_drifted_counters().order_by("id")
+        for recipe in drifted:
+            self.stdout.write(
+                f"Рецепт {recipe.id}: в избранном {recipe.favorites_count} "
+                f"(фактически {recipe.actual_favorites_count}), "
+                f"в списках покупок {recipe.in_carts_count} "
+                f"(фактически {recipe.actual_in_carts_count})"
+            )
+        if drifted:
+            self.stdout.write(self.style.ERROR(
+                f"Расхождений: {len(drifted)}."
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                "Счётчики совпадают с фактическими."
+            ))
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    totals = RecipeIngredient.objects.filter(
+        recipe__shoppingcart__isnull=False
+    ).values(
+        "ingredient_id",
+        user_id=models.F("recipe__shoppingcart__user_id"),
+    ).annotate(total=models.Sum("amount")).order_by()
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(user_id=item["user_id"],
+                             ingredient_id=item["ingredient_id"],
+                             amount=item["total"])
+            for item in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(default=0)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='recipes.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
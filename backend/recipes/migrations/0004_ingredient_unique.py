@@ -0,0 +1,78 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+def merge_recipe_ingredients(RecipeIngredient, ingredient_id):
+    # Рецепт мог ссылаться на несколько дублей: их количества суммируются.
+    repeated = RecipeIngredient.objects.filter(
+        ingredient_id=ingredient_id
+    ).values("recipe_id").annotate(
+        first=models.Min("id"),
+        count=models.Count("id"),
+        total=models.Sum("amount"),
+    ).filter(count__gt=1).order_by()
+    for row in repeated:
+        RecipeIngredient.objects.filter(id=row["first"]).update(
+            amount=row["total"])
+        RecipeIngredient.objects.filter(
+            recipe_id=row["recipe_id"], ingredient_id=ingredient_id
+        ).exclude(id=row["first"]).delete()
+
+
+def remove_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    duplicates = list(
+        Ingredient.objects.values("name", "measurement_unit").annotate(
+            first=models.Min("id"), count=models.Count("id")
+        ).filter(count__gt=1).order_by()
+    )
+    if not duplicates:
+        return
+    removed_ids = []
+    for row in duplicates:
+        ids = list(Ingredient.objects.filter(
+            name=row["name"], measurement_unit=row["measurement_unit"]
+        ).exclude(id=row["first"]).values_list("id", flat=True))
+        RecipeIngredient.objects.filter(ingredient_id__in=ids).update(
+            ingredient_id=row["first"])
+        merge_recipe_ingredients(RecipeIngredient, row["first"])
+        removed_ids.extend(ids)
+    # Списки покупок с удаляемыми ингредиентами пересчитываются по корзине.
+    user_ids = set(ShoppingListItem.objects.filter(
+        ingredient_id__in=removed_ids).values_list("user_id", flat=True))
+    ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+    totals = RecipeIngredient.objects.filter(
+        recipe__shoppingcart__user_id__in=user_ids
+    ).values(
+        "ingredient_id",
+        user_id=models.F("recipe__shoppingcart__user_id"),
+    ).annotate(total=models.Sum("amount")).order_by()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=item["user_id"],
+                         ingredient_id=item["ingredient_id"],
+                         amount=item["total"])
+        for item in totals
+    ])
+    Ingredient.objects.filter(id__in=removed_ids).delete()
+    if schema_editor.connection.vendor == "postgresql":
+        # Отложенные проверки внешних ключей на удалённые строки
+        # не дают изменить recipes_ingredient в этой же транзакции.
+        schema_editor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    RecipeIngredient = apps.get_model("recipes", "RecipeIngredient")
+    ShoppingListItem = apps.get_model("recipes", "ShoppingListItem")
+    for name in ("Favorite", "ShoppingCart"):
+        model = apps.get_model("recipes", name)
+        duplicates = list(model.objects.values("user", "recipe").annotate(
+            first=models.Min("id"), count=models.Count("id")
+        ).filter(count__gt=1).order_by())
+        for row in duplicates:
+            model.objects.filter(
+                user=row["user"], recipe=row["recipe"]
+            ).exclude(id=row["first"]).delete()
+        if name != "ShoppingCart" or not duplicates:
+            continue
+        # Дубли в корзине учитывались в списке покупок дважды.
+        user_ids = {row["user"] for row in duplicates}
+        ShoppingListItem.objects.filter(user_id__in=user_ids).delete()
+        totals = RecipeIngredient.objects.filter(
+            recipe__shoppingcart__user_id__in=user_ids
+        ).values(
+            "ingredient_id",
+            user_id=models.F("recipe__shoppingcart__user_id"),
+        ).annotate(total=models.Sum("amount")).order_by()
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user_id=item["user_id"],
+                             ingredient_id=item["ingredient_id"],
+                             amount=item["total"])
+            for item in totals
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
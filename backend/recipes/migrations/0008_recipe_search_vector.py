@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:17
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.search import create_postgresql_index, drop_postgresql_index
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        create_postgresql_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        drop_postgresql_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_pub_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:21
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    FeedEntry = apps.get_model("recipes", "FeedEntry")
+    Recipe = apps.get_model("recipes", "Recipe")
+    Subscribe = apps.get_model("users", "Subscribe")
+    large_authors = Subscribe.objects.values("author_id").annotate(
+        followers=models.Count("id")
+    ).filter(followers__gt=settings.FEED_FANOUT_LIMIT).values("author_id")
+    entries = Recipe.objects.filter(
+        author__following__isnull=False
+    ).exclude(
+        author_id__in=large_authors
+    ).values_list(
+        "id", "author_id", "pub_date", "author__following__user_id"
+    ).order_by()
+    entries = entries.iterator()
+    while True:
+        batch = [
+            FeedEntry(recipe_id=recipe_id, author_id=author_id,
+                      pub_date=pub_date, user_id=user_id)
+            for recipe_id, author_id, pub_date, user_id
+            in islice(entries, 1000)
+        ]
+        if not batch:
+            return
+        FeedEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_search_vector'),
+        ('users', '0002_unique_subscribe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_entry_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'author'], name='feed_entry_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:22
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count_rows(model):
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(recipe_id=models.OuterRef("pk"))
+            .order_by().values("recipe_id")
+            .annotate(total=models.Count("id")).values("total")
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    Recipe.objects.update(
+        favorites_count=count_rows(apps.get_model("recipes", "Favorite")),
+        in_carts_count=count_rows(apps.get_model("recipes", "ShoppingCart")),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-in_carts_count', '-id'], name='recipe_in_carts_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,14 @@
+from itertools import islice
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import (Case, Count, Exists, F, IntegerField,
+                              OuterRef, Q, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
+
+from users.models import Subscribe
 
 User = get_user_model()
 
@@ -26,11 +35,59 @@ class Ingredient(models.Model):
         ordering = ["name"]
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"),
+                name="unique_ingredient",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def change_counter(self, field, delta):
+        """Атомарно меняет счётчик, не опуская его ниже нуля."""
+        recipes = self
+        if delta < 0:
+            recipes = recipes.filter(**{f"{field}__gte": -delta})
+        return recipes.update(**{field: F(field) + delta})
+
+    def with_actual_counters(self):
+        return self.annotate(
+            actual_favorites_count=count_recipe_rows(Favorite),
+            actual_in_carts_count=count_recipe_rows(ShoppingCart),
+        )
+
+    def with_drifted_counters(self):
+        return self.with_actual_counters().exclude(
+            favorites_count=F("actual_favorites_count"),
+            in_carts_count=F("actual_in_carts_count"),
+        )
+
+    def reconcile_counters(self):
+        """Пересчитывает разошедшиеся счётчики; возвращает число
+        исправленных рецептов.
+        """
+        drifted = self.with_drifted_counters().values_list("id", flat=True)
+        return self.model.objects.filter(id__in=list(drifted)).update(
+            favorites_count=count_recipe_rows(Favorite),
+            in_carts_count=count_recipe_rows(ShoppingCart),
+        )
+
+
+def count_recipe_rows(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe_id=OuterRef("pk"))
+            .order_by().values("recipe_id")
+            .annotate(total=Count("id")).values("total")
+        ),
+        0,
+    )
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(Tag)
     name = models.CharField(max_length=200)
@@ -42,15 +99,35 @@ class Recipe(models.Model):
         related_name="author"
     )
     image = models.ImageField(upload_to="recipes/", default=None)
+    image_card = models.ImageField(
+        upload_to="recipes/card/", blank=True, editable=False)
+    image_detail = models.ImageField(
+        upload_to="recipes/detail/", blank=True, editable=False)
     ingredients = models.ManyToManyField(
         Ingredient,
         through="RecipeIngredient"
     )
+    pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        "В избранном", default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        "В списках покупок", default=0, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ["name"]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(fields=("-pub_date", "-id"),
+                         name="recipe_pub_date_idx"),
+            models.Index(fields=("-favorites_count", "-id"),
+                         name="recipe_favorites_count_idx"),
+            models.Index(fields=("-in_carts_count", "-id"),
+                         name="recipe_in_carts_count_idx"),
+        ]
 
     def __str__(self):
         return self.name
@@ -81,6 +158,12 @@ class Favorite(models.Model):
         verbose_name = "Избранный рецепт"
         verbose_name_plural = "Избранные рецепты"
         ordering = ("id",)
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="unique_favorite",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} добавил {self.recipe} в избранное."
@@ -93,6 +176,269 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = "Корзина покупок"
         verbose_name_plural = "Корзины покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="unique_shopping_cart",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} добавил {self.recipe} в корзину покупок."
+
+
+class ShoppingListManager(models.Manager):
+    """Инкрементальное обновление агрегированного списка покупок."""
+
+    def get_amounts(self, recipe_ids):
+        return dict(
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .values("ingredient_id")
+            .annotate(total=Sum("amount"))
+            .values_list("ingredient_id", "total")
+        )
+
+    def change(self, user_ids, amounts):
+        """Прибавляет `amounts` (ингредиент -> количество) к спискам
+        покупок пользователей; отрицательные значения вычитаются.
+        """
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items()
+                if amount > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items = self.filter(user_id__in=user_ids,
+                            ingredient_id__in=amounts)
+        items.update(amount=F("amount") + Case(
+            *[
+                When(ingredient_id=ingredient_id, then=Value(amount))
+                for ingredient_id, amount in amounts.items()
+            ],
+            output_field=IntegerField(),
+        ))
+        items.filter(amount__lte=0).delete()
+
+    def add_recipes(self, user, recipe_ids):
+        self.change([user.id], self.get_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        self.change([user.id], {
+            ingredient_id: -amount
+            for ingredient_id, amount in self.get_amounts(recipe_ids).items()
+        })
+
+    def calculate(self, user_ids=None):
+        """Собирает списки покупок заново из корзин."""
+        carts = ShoppingCart.objects.all()
+        if user_ids is not None:
+            carts = carts.filter(user_id__in=user_ids)
+        return {
+            (item["user_id"], item["ingredient_id"]): item["total"]
+            for item in RecipeIngredient.objects.filter(
+                recipe__shoppingcart__in=carts
+            ).values(
+                "ingredient_id",
+                user_id=F("recipe__shoppingcart__user_id"),
+            ).annotate(total=Sum("amount")).order_by()
+        }
+
+    def rebuild(self, user_ids=None):
+        items = self.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=amount)
+                for (user_id, ingredient_id), amount
+                in self.calculate(user_ids).items()
+            ],
+            batch_size=1000,
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="shopping_list")
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    amount = models.IntegerField(default=0)
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Списки покупок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="unique_shopping_list_item",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.ingredient} – {self.amount}"
+
+
+class FeedManager(models.Manager):
+    """Лента рецептов авторов, на которых подписан пользователь.
+
+    Рецепты авторов, у которых не больше `FEED_FANOUT_LIMIT` подписчиков,
+    раскладываются по лентам при публикации. Более популярные авторы
+    отмечаются `User.is_large_author`: их рецепты в ленты не пишутся
+    и подмешиваются при чтении. Отметка снимается только при полной
+    пересборке лент.
+    """
+
+    def get_followers(self, author_id):
+        return Subscribe.objects.filter(author_id=author_id).order_by()
+
+    def is_large_author(self, author_id):
+        return self.get_followers(author_id)[
+            settings.FEED_FANOUT_LIMIT:].exists()
+
+    def get_large_authors(self, user):
+        return list(
+            Subscribe.objects.filter(
+                user=user, author__is_large_author=True
+            ).values_list("author_id", flat=True)
+        )
+
+    def mark_large_authors(self, author_ids):
+        User.objects.filter(
+            id__in=author_ids, is_large_author=False
+        ).update(is_large_author=True)
+
+    def update_large_authors(self, clear=False):
+        """Отмечает авторов, у которых больше `FEED_FANOUT_LIMIT`
+        подписчиков; с `clear` снимает отметку с остальных.
+        """
+        large_authors = Subscribe.objects.values("author_id").annotate(
+            followers=Count("id")
+        ).filter(
+            followers__gt=settings.FEED_FANOUT_LIMIT
+        ).values("author_id").order_by()
+        self.mark_large_authors(large_authors)
+        if clear:
+            User.objects.filter(is_large_author=True).exclude(
+                id__in=large_authors).update(is_large_author=False)
+
+    def publish(self, recipe):
+        if self.is_large_author(recipe.author_id):
+            self.mark_large_authors([recipe.author_id])
+            return
+        self.bulk_create(
+            [
+                self.model(user_id=user_id, recipe=recipe,
+                           author_id=recipe.author_id,
+                           pub_date=recipe.pub_date)
+                for user_id in self.get_followers(
+                    recipe.author_id).values_list("user_id", flat=True)
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def follow(self, user, author):
+        self.follow_authors(user, [author.id])
+
+    def follow_authors(self, user, author_ids):
+        if not author_ids:
+            return
+        large_authors = list(
+            User.objects.filter(id__in=author_ids).filter(
+                Q(is_large_author=True)
+                | Exists(self.get_followers(OuterRef("pk"))[
+                    settings.FEED_FANOUT_LIMIT:])
+            ).values_list("id", flat=True)
+        )
+        if large_authors:
+            self.mark_large_authors(large_authors)
+        self.bulk_create(
+            [
+                self.model(user=user, recipe_id=recipe_id,
+                           author_id=author_id, pub_date=pub_date)
+                for recipe_id, author_id, pub_date in Recipe.objects.filter(
+                    author_id__in=author_ids
+                ).exclude(
+                    author_id__in=large_authors
+                ).values_list("id", "author_id", "pub_date")
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+    def unfollow(self, user, author_id):
+        self.unfollow_authors(user, [author_id])
+
+    def unfollow_authors(self, user, author_ids):
+        self.filter(user=user, author_id__in=author_ids).delete()
+
+    def rebuild(self, user_ids=None):
+        """Собирает ленты заново, например после того, как число
+        подписчиков автора опустилось ниже `FEED_FANOUT_LIMIT`.
+        """
+        self.update_large_authors(clear=user_ids is None)
+        entries = self.all()
+        subscriptions = Subscribe.objects.exclude(
+            author__is_large_author=True)
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+            subscriptions = subscriptions.filter(user_id__in=user_ids)
+        entries.delete()
+        recipes = Recipe.objects.filter(
+            author__following__in=subscriptions
+        ).values_list(
+            "id", "author_id", "pub_date", "author__following__user_id"
+        ).order_by().iterator()
+        while True:
+            batch = [
+                self.model(recipe_id=recipe_id, author_id=author_id,
+                           pub_date=pub_date, user_id=user_id)
+                for recipe_id, author_id, pub_date, user_id
+                in islice(recipes, 1000)
+            ]
+            if not batch:
+                return
+            self.bulk_create(batch)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="feed")
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name="feed_entries")
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+")
+    pub_date = models.DateTimeField("Дата публикации")
+
+    objects = FeedManager()
+
+    class Meta:
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Ленты подписок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="unique_feed_entry",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=("user", "-pub_date", "-recipe"),
+                         name="feed_entry_user_idx"),
+            models.Index(fields=("user", "author"),
+                         name="feed_entry_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user}: {self.recipe}"
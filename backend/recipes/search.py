@@ -0,0 +1,136 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, Q
+
+SEARCH_CONFIG = "russian"
+FTS_TABLE = "recipes_recipe_fts"
+
+POSTGRESQL_SEARCH_VECTOR = (
+    "setweight(to_tsvector('{config}', coalesce({row}.name, '')), 'A') || "
+    "setweight(to_tsvector('{config}', coalesce({row}.text, '')), 'B')"
+)
+
+POSTGRESQL_CREATE = (
+    f"""
+    CREATE OR REPLACE FUNCTION recipes_recipe_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {POSTGRESQL_SEARCH_VECTOR.format(
+            config=SEARCH_CONFIG, row="NEW")};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE PROCEDURE recipes_recipe_search_vector_update()
+    """,
+    f"""
+    UPDATE recipes_recipe SET search_vector = {POSTGRESQL_SEARCH_VECTOR.format(
+        config=SEARCH_CONFIG, row="recipes_recipe")}
+    """,
+    """
+    CREATE INDEX recipe_search_vector_idx ON recipes_recipe
+    USING gin (search_vector)
+    """,
+)
+
+POSTGRESQL_DROP = (
+    "DROP INDEX IF EXISTS recipe_search_vector_idx",
+    "DROP TRIGGER IF EXISTS recipes_recipe_search_vector_trigger "
+    "ON recipes_recipe",
+    "DROP FUNCTION IF EXISTS recipes_recipe_search_vector_update()",
+)
+
+SQLITE_CREATE = (
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')",
+)
+
+
+def create_postgresql_index(schema_editor):
+    for sql in POSTGRESQL_CREATE:
+        schema_editor.execute(sql)
+
+
+def drop_postgresql_index(schema_editor):
+    for sql in POSTGRESQL_DROP:
+        schema_editor.execute(sql)
+
+
+def create_sqlite_index(using):
+    """Создаёт таблицу FTS5 и триггеры, если их нет.
+
+    SQLite пересоздаёт таблицу рецептов при изменении её схемы и теряет
+    триггеры, поэтому функция вызывается после каждого `migrate`.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+            "AND tbl_name = 'recipes_recipe' AND name LIKE %s",
+            [f"{FTS_TABLE}_%"],
+        )
+        if cursor.fetchone()[0] == 3:
+            return
+        for sql in SQLITE_CREATE:
+            cursor.execute(sql)
+
+
+def get_fts_query(value):
+    return " ".join(
+        '"{}"*'.format(word.replace('"', '""')) for word in value.split())
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию и описанию рецепта.
+
+    Результаты упорядочены по релевантности; совпадения в названии
+    весят больше совпадений в описании.
+    """
+    if not value.split():
+        return queryset
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        query = SearchQuery(value, config=SEARCH_CONFIG,
+                            search_type="websearch")
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F("search_vector"), query)
+        ).order_by("-search_rank", "-id")
+    if vendor == "sqlite":
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = recipes_recipe.id",
+                   f"{FTS_TABLE} MATCH %s"],
+            params=[get_fts_query(value)],
+            select={"search_rank": f"bm25({FTS_TABLE}, 10.0, 1.0)"},
+        ).order_by("search_rank", "-id")
+    return queryset.filter(
+        Q(name__icontains=value) | Q(text__icontains=value))
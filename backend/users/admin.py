@@ -1,4 +1,6 @@
 from django.contrib import admin
+
+from foodgram.paginators import EstimatedCountPaginator
 from users.models import Subscribe, User
 
 
@@ -10,15 +12,18 @@ class UserAdmin(admin.ModelAdmin):
         "username",
         "email",
     )
-    list_filter = (
-        "username",
-        "email",
-    )
+    list_filter = ("is_staff", "is_active")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
 
 @admin.register(Subscribe)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "author")
-    search_fields = ("user", "author")
+    list_select_related = ("user", "author")
+    search_fields = ("user__username", "author__username")
+    autocomplete_fields = ("user", "author")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+def remove_duplicates(apps, schema_editor):
+    Subscribe = apps.get_model("users", "Subscribe")
+    duplicates = list(Subscribe.objects.values("user", "author").annotate(
+        first=models.Min("id"), count=models.Count("id")
+    ).filter(count__gt=1).order_by())
+    for row in duplicates:
+        Subscribe.objects.filter(
+            user=row["user"], author=row["author"]
+        ).exclude(id=row["first"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscribe',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_subscribe'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_large_authors(apps, schema_editor):
+    Subscribe = apps.get_model("users", "Subscribe")
+    User = apps.get_model("users", "User")
+    large_authors = Subscribe.objects.values("author_id").annotate(
+        followers=models.Count("id")
+    ).filter(
+        followers__gt=settings.FEED_FANOUT_LIMIT
+    ).values("author_id").order_by()
+    User.objects.filter(id__in=large_authors).update(is_large_author=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_unique_subscribe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='is_large_author',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Много подписчиков'),
+        ),
+        migrations.RunPython(mark_large_authors, migrations.RunPython.noop),
+    ]
@@ -27,6 +27,13 @@ class User(AbstractUser):
         verbose_name="В подписках",
         default=False,
     )
+    # Рецепты автора не раскладываются по лентам подписчиков, а
+    # подмешиваются при чтении, см. `recipes.models.FeedManager`.
+    is_large_author = models.BooleanField(
+        verbose_name="Много подписчиков",
+        default=False,
+        editable=False,
+    )
 
     class Meta:
         ordering = ["id"]
@@ -50,3 +57,9 @@ class Subscribe(models.Model):
         ordering = ["-id"]
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "author"),
+                name="unique_subscribe",
+            ),
+        ]